@@ -1,13 +1,67 @@
 #!/usr/bin/env python3
 
 import argparse
+import string
 import sys
 from base64 import b64decode
 from typing import BinaryIO
 
+CHUNK_SIZE = 1 << 20
 
-def decode(input_stream: BinaryIO, output_stream: BinaryIO) -> None:
-    output_stream.write(b64decode(input_stream.read()))
+_ALPHABET = (string.ascii_letters + string.digits + "+/=").encode()
+_NON_ALPHABET = bytes(c for c in range(256) if c not in _ALPHABET)
+_PAD = ord("=")
+
+
+def _scan(data: bytes) -> tuple[int, bool]:
+    """
+    Return the end of the last whole quantum of data, which starts on a
+    quantum boundary, and whether decoding stops there because the quantum
+    is padded. Like b64decode, padding that does not follow at least two
+    characters of a quantum is ignored.
+    """
+    start = data.find(b"=")
+    if start < 0:
+        return len(data) - len(data) % 4, False
+    quad_pos = start % 4
+    end = start - quad_pos
+    pads = 0
+    for i in range(start, len(data)):
+        if data[i] != _PAD:
+            pads = 0
+            quad_pos = (quad_pos + 1) % 4
+            if quad_pos == 0:
+                end = i + 1
+        elif quad_pos == 0:
+            end = i + 1
+        elif quad_pos >= 2:
+            pads += 1
+            if quad_pos + pads >= 4:
+                return i + 1, True
+    return end, False
+
+
+def decode(
+    input_stream: BinaryIO,
+    output_stream: BinaryIO,
+    chunk_size: int = CHUNK_SIZE,
+) -> None:
+    # Non-alphabet characters (such as the newlines of MIME-wrapped input)
+    # are discarded before decoding, so that each chunk can be split on a
+    # 4-character quantum boundary and the remainder carried over to the
+    # next one.
+    pending = b""
+    while chunk := input_stream.read(chunk_size):
+        data = pending + chunk.translate(None, _NON_ALPHABET)
+        end, padded = _scan(data)
+        output_stream.write(b64decode(data[:end]))
+        if padded:
+            # the input after a padded quantum is ignored
+            while input_stream.read(chunk_size):
+                pass
+            return
+        pending = data[end:]
+    output_stream.write(b64decode(pending))
 
 
 def main() -> None:
@@ -1,22 +1,97 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import argparse
+import codecs
+import heapq
 import json
+import locale
+import os
 import re
+import struct
+import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+from typing import TYPE_CHECKING, TextIO
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+CHUNK_SIZE = 1 << 22
+
+WORD_RE = re.compile(r"([^\W\d_]\w+)\b")
+SPACE_RE = re.compile(rb"\s")
+
+SHARD_MAGIC = b"EXGCW001"
+# word count and length of the UTF-8 encoded word
+SHARD_RECORD = struct.Struct("<QI")
+
+
+def _split_tail(text: str) -> int:
+    """
+    Return the start of the trailing word characters of text, which may
+    continue in the next block.
+    """
+    i = len(text)
+    while i > 0 and (text[i - 1].isalnum() or text[i - 1] == "_"):
+        i -= 1
+    return i
 
 
 class Index:
     def __init__(self) -> None:
-        self.index: dict[str, int] = {}
-        self.re = re.compile(r"([^\W\d_]\w+)\b")
+        self.index: Counter[str] = Counter()
+        self.re = WORD_RE
 
     def add(self, line: str) -> None:
-        for match in self.re.finditer(line):
-            word = match.group(1)
-            if word in self.index:
-                self.index[word] += 1
-            else:
-                self.index[word] = 1
+        self.index.update(self.re.findall(line))
+
+    def add_file(
+        self,
+        path: str,
+        start: int = 0,
+        end: int | None = None,
+        encoding: str | None = None,
+    ) -> None:
+        """
+        Add the words contained in the byte range [start, end) of a file.
+        """
+        if encoding is None:
+            encoding = locale.getpreferredencoding(False)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        tail = ""
+        with open(path, "rb") as f:
+            f.seek(start)
+            if end is None:
+                end = os.fstat(f.fileno()).st_size
+            size = end - start
+            while size > 0:
+                data = f.read(min(size, CHUNK_SIZE))
+                if not data:
+                    break
+                size -= len(data)
+                text = tail + decoder.decode(data)
+                split = _split_tail(text)
+                self.add(text[:split])
+                tail = text[split:]
+        self.add(tail + decoder.decode(b"", final=True))
+
+    def merge(self, other: Index) -> None:
+        self.index.update(other.index)
+
+    def load(self, words: Iterable[tuple[str, int]]) -> None:
+        self.index.update(dict(words))
+
+    def save(self, path: str) -> None:
+        write_shard(path, sorted(self.index.items()))
+
+    def most_common(self, k: int | None = None) -> list[tuple[str, int]]:
+        # selects the top k words with heapq.nlargest, if k is not None
+        return self.index.most_common(k)
 
     def encode(self) -> str:
         return json.dumps(
@@ -24,20 +99,191 @@ class Index:
             indent=4,
         )
 
+    def write(
+        self,
+        stream: TextIO,
+        output_format: str = "json",
+        k: int | None = None,
+    ) -> None:
+        """
+        Write the words sorted by frequency, or the k most frequent ones,
+        one at a time.
+        """
+        for data in FORMATS[output_format](self.most_common(k)):
+            stream.write(data)
+
+
+def _format_json(words: list[tuple[str, int]]) -> Iterator[str]:
+    # same output as json.dumps(..., indent=4) on the list of words
+    if not words:
+        yield "[]\n"
+        return
+    separator = "[\n"
+    for word, _ in words:
+        yield f"{separator}    {json.dumps(word)}"
+        separator = ",\n"
+    yield "\n]\n"
+
+
+def _format_ndjson(words: list[tuple[str, int]]) -> Iterator[str]:
+    for word, count in words:
+        yield json.dumps({"word": word, "count": count}) + "\n"
+
+
+def _format_tsv(words: list[tuple[str, int]]) -> Iterator[str]:
+    for word, count in words:
+        yield f"{word}\t{count}\n"
+
+
+FORMATS = {
+    "json": _format_json,
+    "ndjson": _format_ndjson,
+    "tsv": _format_tsv,
+}
+
+
+def write_shard(path: str, words: Iterable[tuple[str, int]]) -> None:
+    """
+    Write a sequence of (word, count) pairs sorted by word to a shard file.
+    """
+    # the shard is replaced only once complete, so path may also be one of
+    # the shards being merged into words
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(os.path.abspath(path)),
+        delete=False,
+    ) as f:
+        try:
+            f.write(SHARD_MAGIC)
+            for word, count in words:
+                data = word.encode("utf-8")
+                f.write(SHARD_RECORD.pack(count, len(data)))
+                f.write(data)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, path)
+
+
+def read_shard(path: str) -> Iterator[tuple[str, int]]:
+    with open(path, "rb", buffering=1 << 16) as f:
+        if f.read(len(SHARD_MAGIC)) != SHARD_MAGIC:
+            raise ValueError(f"{path}: not a word count shard")
+        while header := f.read(SHARD_RECORD.size):
+            if len(header) < SHARD_RECORD.size:
+                raise ValueError(f"{path}: truncated shard")
+            count, size = SHARD_RECORD.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                raise ValueError(f"{path}: truncated shard")
+            yield data.decode("utf-8"), count
+
+
+def merge_shards(
+    shards: Iterable[Iterable[tuple[str, int]]],
+) -> Iterator[tuple[str, int]]:
+    """
+    Merge sequences of (word, count) pairs sorted by word, summing the
+    counts of the same word.
+    """
+    merged = heapq.merge(*shards, key=itemgetter(0))
+    for word, group in groupby(merged, key=itemgetter(0)):
+        yield word, sum(count for _, count in group)
+
+
+def _split_file(path: str, n: int) -> list[int]:
+    """
+    Split a file in n ranges of about the same size, ending at whitespace.
+    """
+    size = os.path.getsize(path)
+    offsets = [0]
+    with open(path, "rb") as f:
+        for i in range(1, n):
+            offset = max(size * i // n, offsets[-1])
+            f.seek(offset)
+            while data := f.read(1 << 16):
+                match = SPACE_RE.search(data)
+                if match:
+                    offset += match.end()
+                    break
+                offset += len(data)
+            offsets.append(offset)
+    offsets.append(size)
+    return offsets
+
+
+def _count_range(path: str, start: int, end: int) -> Index:
+    index = Index()
+    index.add_file(path, start, end)
+    return index
+
+
+def count_words(path: str, jobs: int = 1) -> Index:
+    index = Index()
+    if jobs <= 1:
+        index.add_file(path)
+        return index
+    offsets = _split_file(path, jobs)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        paths = [path] * jobs
+        for shard in executor.map(_count_range, paths, offsets, offsets[1:]):
+            index.merge(shard)
+    return index
+
 
 def main() -> None:
     """
     List the words contained in a file, sorted by frequency.
     """
     parser = argparse.ArgumentParser(description=main.__doc__)
-    parser.add_argument("file")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="count the words of JOBS parts of the file in parallel",
+    )
+    parser.add_argument(
+        "-k",
+        "--top",
+        type=int,
+        help="list only the TOP most frequent words",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=FORMATS,
+        default="json",
+        help="output format; ndjson and tsv include the word counts",
+    )
+    parser.add_argument(
+        "-s",
+        "--shard",
+        action="append",
+        default=[],
+        help="add the word counts saved in the shard SHARD",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="save the word counts to the shard OUTPUT",
+    )
+    parser.add_argument("files", metavar="file", nargs="*")
     args = parser.parse_args()
+    if not args.files and not args.shard:
+        parser.error("at least one file or shard is required")
 
     index = Index()
-    with open(args.file) as f:
-        for line in f:
-            index.add(line.rstrip())
-    print(index.encode())
+    for path in args.files:
+        index.merge(count_words(path, args.jobs))
+    if args.shard or args.output:
+        shards = [read_shard(path) for path in args.shard]
+        words = merge_shards([sorted(index.index.items()), *shards])
+        if args.output:
+            write_shard(args.output, words)
+            return
+        index = Index()
+        index.load(words)
+    index.write(sys.stdout, args.format, args.top)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import bisect
+import mmap
 from ctypes import (
+    Array,
     BigEndianStructure,
     LittleEndianStructure,
     Structure,
@@ -13,6 +16,22 @@ from ctypes import (
     sizeof,
 )
 from dataclasses import dataclass
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from io import BufferedReader
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
 
 
 class e_ident(Structure):
@@ -148,101 +167,154 @@ class dyn64_be(BigEndianStructure):
     _fields_ = (("d_tag", c_int64), ("d_val", c_uint64))
 
 
-def read_struct(stream, stype):
-    data = stream.read(sizeof(stype))
-    if len(data) < sizeof(stype):
-        return None
-    return stype.from_buffer_copy(data)
-
-
-class _StringTable:
-    def __init__(self, stream, offset):
-        self._stream = stream
-        self._offset = offset
-
-    def get_string(self, offset):
-        self._stream.seek(self._offset + offset)
-        CHUNKSIZE = 64
-        string = b""
-        while True:
-            chunk = self._stream.read(CHUNKSIZE)
-            end_index = chunk.find(b"\x00")
-            if end_index >= 0:
-                string += chunk[:end_index]
-                return string.decode("latin-1")
-            if len(chunk) < CHUNKSIZE:
-                return None
-            string += chunk
+def _map_file(stream: BufferedReader) -> mmap.mmap | bytearray:
+    # a private mapping is writable, which lets ctypes structures be
+    # created from it without copying
+    try:
+        return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_COPY)
+    except (OSError, ValueError):
+        stream.seek(0)
+        return bytearray(stream.read())
 
 
 @dataclass
 class Layout:
-    ehdr: LittleEndianStructure | BigEndianStructure
-    phdr: LittleEndianStructure | BigEndianStructure
-    dyn: LittleEndianStructure | BigEndianStructure
+    ehdr: type[Structure]
+    phdr: type[Structure]
+    dyn: type[Structure]
 
 
 class ELFInfo:
-    def __init__(self, stream):
+    def __init__(self, stream: BufferedReader) -> None:
         self._stream = stream
-        self._header = None
-        self._read_header()
-        if not self._header:
+        header = self._read_header()
+        if not header:
             raise ValueError
+        self._header = header
 
-    def _read_header(self):
+    def _read_header(self) -> Structure | None:
         self._stream.seek(0)
         data = self._stream.peek(sizeof(e_ident))
         if len(data) < sizeof(e_ident):
-            return
+            return None
         ident = e_ident.from_buffer_copy(data)
+        self._ident = ident
         if ident.EI_MAG[0:4] != [0x7F, 0x45, 0x4C, 0x46]:
-            return
+            return None
         if ident.EI_CLASS == 2:
             if ident.EI_DATA == 1:
-                self._header = read_struct(self._stream, ehdr64_le)
                 self._layout = Layout(ehdr64_le, phdr64_le, dyn64_le)
             else:
-                self._header = read_struct(self._stream, ehdr64_be)
                 self._layout = Layout(ehdr64_be, phdr64_be, dyn64_be)
         elif ident.EI_CLASS == 1:
             if ident.EI_DATA == 1:
-                self._header = read_struct(self._stream, ehdr32_le)
                 self._layout = Layout(ehdr32_le, phdr32_le, dyn32_le)
             else:
-                self._header = read_struct(self._stream, ehdr32_be)
                 self._layout = Layout(ehdr32_be, phdr32_be, dyn32_be)
+        else:
+            return None
+        self._data = _map_file(self._stream)
+        headers = self._read_array(self._layout.ehdr, 0, 1)
+        return headers[0] if headers else None
+
+    def _read_array(
+        self,
+        stype: type[Structure],
+        offset: int,
+        count: int,
+    ) -> Array[Structure] | None:
+        if offset + sizeof(stype) * count > len(self._data):
+            return None
+        return (stype * count).from_buffer(self._data, offset)
 
-    def _get_dyn_offset(self):
+    def _get_string(self, offset: int) -> str | None:
+        end = self._data.find(b"\x00", offset)
+        if end < 0:
+            return None
+        return self._data[offset:end].decode("latin-1")
+
+    def _get_pheaders(self) -> Iterable[Structure]:
         if not self._header.e_phoff:
+            return ()
+        pheaders = self._read_array(
+            self._layout.phdr,
+            self._header.e_phoff,
+            self._header.e_phnum,
+        )
+        return pheaders or ()
+
+    @cached_property
+    def _load_segments(self) -> tuple[list[int], list[tuple[int, int, int]]]:
+        segments = sorted(
+            (pheader.p_vaddr, pheader.p_offset, pheader.p_filesz)
+            for pheader in self._get_pheaders()
+            if pheader.p_type == PT_LOAD
+        )
+        return [segment[0] for segment in segments], segments
+
+    def _vaddr_to_offset(self, vaddr: int) -> int | None:
+        vaddrs, segments = self._load_segments
+        i = bisect.bisect_right(vaddrs, vaddr) - 1
+        if i < 0:
             return None
-        self._stream.seek(self._header.e_phoff)
-        for _ in range(self._header.e_phnum):
-            pheader = read_struct(self._stream, self._layout.phdr)
-            if not pheader:
-                return None
-            if pheader.p_type == 2:
-                return pheader.p_offset
-        return None
-
-    def get_deps(self):
-        offset = self._get_dyn_offset()
-        if not offset:
-            return
-        self._stream.seek(offset)
-        offsets = []
-        strtab_offset = None
-        while True:
-            dyn = read_struct(self._stream, self._layout.dyn)
-            if not dyn:
-                return
-            if dyn.d_tag == 0:
+        start, offset, size = segments[i]
+        if vaddr - start >= size:
+            return None
+        return offset + vaddr - start
+
+    @cached_property
+    def _dynamic(self) -> dict[int, list[int]]:
+        entries: dict[int, list[int]] = {}
+        for pheader in self._get_pheaders():
+            if pheader.p_type == PT_DYNAMIC:
+                break
+        else:
+            return entries
+        if not pheader.p_offset:
+            return entries
+        count = pheader.p_filesz // sizeof(self._layout.dyn)
+        dyns = self._read_array(self._layout.dyn, pheader.p_offset, count)
+        for dyn in dyns or ():
+            if dyn.d_tag == DT_NULL:
                 break
-            if dyn.d_tag == 1:
-                offsets.append(dyn.d_val)
-            elif dyn.d_tag == 5:
-                strtab_offset = dyn.d_val
-        if not strtab_offset:
+            entries.setdefault(dyn.d_tag, []).append(dyn.d_val)
+        return entries
+
+    def _get_dyn_strings(self, tag: int) -> Iterator[str | None]:
+        if DT_STRTAB not in self._dynamic:
+            return
+        strtab_offset = self._vaddr_to_offset(self._dynamic[DT_STRTAB][0])
+        if strtab_offset is None:
             return
-        string_table = _StringTable(self._stream, strtab_offset)
-        yield from (string_table.get_string(offset) for offset in offsets)
+        for offset in self._dynamic.get(tag, ()):
+            yield self._get_string(strtab_offset + offset)
+
+    @property
+    def elf_class(self) -> int:
+        return 64 if self._ident.EI_CLASS == 2 else 32
+
+    @property
+    def machine(self) -> int:
+        return int(self._header.e_machine)
+
+    def get_deps(self) -> Iterator[str | None]:
+        yield from self._get_dyn_strings(DT_NEEDED)
+
+    def get_soname(self) -> str | None:
+        return next(self._get_dyn_strings(DT_SONAME), None)
+
+    def get_rpath(self) -> list[str]:
+        return [
+            path
+            for string in self._get_dyn_strings(DT_RPATH)
+            if string
+            for path in string.split(":")
+        ]
+
+    def get_runpath(self) -> list[str]:
+        return [
+            path
+            for string in self._get_dyn_strings(DT_RUNPATH)
+            if string
+            for path in string.split(":")
+        ]
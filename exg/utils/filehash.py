@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from io import BufferedReader
+    from types import TracebackType
+
+CHUNK_SIZE = 1 << 20
+SAMPLE_SIZE = 1 << 16
+
+
+def hash_range(f: BufferedReader, offset: int, size: int) -> str:
+    h = hashlib.sha256()
+    buf = memoryview(bytearray(CHUNK_SIZE))
+    f.seek(offset)
+    while size > 0:
+        n = f.readinto(buf[: min(size, CHUNK_SIZE)])
+        if not n:
+            break
+        h.update(buf[:n])
+        size -= n
+    return h.hexdigest()
+
+
+def hash_sample(f: BufferedReader, offset: int, size: int) -> str:
+    """
+    Compute the SHA256 hash of the head and of the tail of a range of a
+    file, or of the whole range if they overlap.
+    """
+    if size <= 2 * SAMPLE_SIZE:
+        return hash_range(f, offset, size)
+    f.seek(offset)
+    head = f.read(SAMPLE_SIZE)
+    f.seek(offset + size - SAMPLE_SIZE)
+    tail = f.read(SAMPLE_SIZE)
+    return hashlib.sha256(head + tail).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return hash_range(f, 0, os.fstat(f.fileno()).st_size)
+
+
+class HashCache:
+    """
+    Cache of sample and full hashes keyed by device, inode, size and
+    modification time.
+    """
+
+    def __init__(self, path: str) -> None:
+        if directory := os.path.dirname(path):
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, "
+            "path BLOB, sample TEXT, digest TEXT, PRIMARY KEY (dev, ino))"
+        )
+
+    def __enter__(self) -> HashCache:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self._db.commit()
+        self._db.close()
+
+    def get(self, st: os.stat_result) -> tuple[str | None, str | None]:
+        row = self._db.execute(
+            "SELECT sample, digest FROM hashes "
+            "WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+            (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        return row or (None, None)
+
+    def put(
+        self,
+        path: str,
+        st: os.stat_result,
+        sample: str | None,
+        digest: str | None,
+    ) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                st.st_dev,
+                st.st_ino,
+                st.st_size,
+                st.st_mtime_ns,
+                os.fsencode(os.path.abspath(path)),
+                sample,
+                digest,
+            ),
+        )
+
+    def prune(self) -> int:
+        """
+        Remove the entries of the files that were deleted or modified.
+        """
+        stale = []
+        query = "SELECT dev, ino, size, mtime_ns, path FROM hashes"
+        for *key, path in self._db.execute(query):
+            try:
+                st = os.stat(path)
+            except OSError:
+                stale.append(key[:2])
+                continue
+            if [st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns] != key:
+                stale.append(key[:2])
+        self._db.executemany(
+            "DELETE FROM hashes WHERE dev = ? AND ino = ?",
+            stale,
+        )
+        return len(stale)
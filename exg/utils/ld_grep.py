@@ -1,36 +1,384 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import argparse
+import os
 import re
+import sqlite3
+import sys
+from multiprocessing import Pool
+from typing import TYPE_CHECKING, Optional
+
+from . import elf, loader, macho
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from types import TracebackType
 
-from . import elf, macho
+MAGICS = (
+    b"\x7fELF",
+    b"\xca\xfe\xba\xbe",
+    b"\xca\xfe\xba\xbf",
+    b"\xce\xfa\xed\xfe",
+    b"\xcf\xfa\xed\xfe",
+    b"\xfe\xed\xfa\xce",
+    b"\xfe\xed\xfa\xcf",
+)
 
+# the path, the format and the dependencies of a file, or None and None if
+# it is not an executable file
+Deps = tuple[str, Optional[str], Optional[list[str]]]
+StatKey = tuple[int, int, int, int]
 
-def grep(paths, include_re):
+
+def find_files(paths: Iterable[str], recursive: bool) -> Iterator[str]:
     for path in paths:
+        if not os.path.isdir(path):
+            yield path
+        elif recursive:
+            stack = [path]
+            while stack:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path
+        else:
+            print(f"{path}: Is a directory", file=sys.stderr)
+
+
+def read_deps(path: str) -> Deps:
+    try:
         with open(path, "rb") as f:
+            if f.read(4) not in MAGICS:
+                return path, None, None
+            info: elf.ELFInfo | macho.MachOInfo
             try:
                 info = elf.ELFInfo(f)
+                file_format = "elf"
             except ValueError:
                 try:
                     info = macho.MachOInfo(f)
+                    file_format = "macho"
                 except ValueError:
-                    continue
-            deps = list(info.get_deps())
-            if any(include_re.search(dep) for dep in deps):
-                yield path, deps
+                    return path, None, None
+            deps = [dep for dep in info.get_deps() if dep is not None]
+            return path, file_format, deps
+    except OSError as e:
+        print(f"{path}: {e.strerror}", file=sys.stderr)
+        return path, None, None
+
+
+def read_all_deps(
+    paths: Iterable[str],
+    jobs: int = 1,
+    ordered: bool = True,
+) -> Iterator[Deps]:
+    if jobs > 1:
+        with Pool(jobs) as pool:
+            imap = pool.imap if ordered else pool.imap_unordered
+            yield from imap(read_deps, paths, chunksize=64)
+    else:
+        yield from map(read_deps, paths)
+
+
+def grep(
+    paths: Iterable[str],
+    include_re: re.Pattern[str],
+    jobs: int = 1,
+    ordered: bool = True,
+) -> Iterator[tuple[str, list[str]]]:
+    for path, _, deps in read_all_deps(paths, jobs, ordered):
+        if deps and any(include_re.search(dep) for dep in deps):
+            yield path, deps
+
+
+def grep_closures(
+    paths: Iterable[str],
+    include_re: re.Pattern[str],
+) -> Iterator[tuple[str, loader.Graph]]:
+    # a single resolver, so that shared libraries are parsed only once
+    resolver = loader.Resolver()
+    for path in paths:
+        graph = resolver.get_closure(path)
+        if graph is None:
+            continue
+        names = {name for edges in graph.values() for name, _ in edges}
+        if any(include_re.search(name) for name in names):
+            yield next(iter(graph)), graph
+
+
+def _stat_key(st: os.stat_result) -> StatKey:
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class DepIndex:
+    """
+    Index of the dependencies of executable files, keyed by path and
+    updated only for the files whose device, inode, size or modification
+    time changed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path BLOB UNIQUE,
+                dev INTEGER,
+                ino INTEGER,
+                size INTEGER,
+                mtime_ns INTEGER,
+                format TEXT
+            );
+            CREATE TABLE IF NOT EXISTS deps (
+                file_id INTEGER,
+                position INTEGER,
+                name TEXT
+            );
+            CREATE INDEX IF NOT EXISTS deps_name ON deps (name);
+            CREATE INDEX IF NOT EXISTS deps_file_id ON deps (file_id);
+            """
+        )
+
+    def __enter__(self) -> DepIndex:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self._db.commit()
+        self._db.close()
+
+    def _delete(self, path: bytes) -> None:
+        self._db.execute(
+            "DELETE FROM deps WHERE file_id IN "
+            "(SELECT id FROM files WHERE path = ?)",
+            (path,),
+        )
+        self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _put(
+        self,
+        path: str,
+        key: StatKey,
+        file_format: str | None,
+        deps: list[str] | None,
+    ) -> None:
+        encoded_path = os.fsencode(path)
+        self._delete(encoded_path)
+        cursor = self._db.execute(
+            "INSERT INTO files (path, dev, ino, size, mtime_ns, format) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (encoded_path, *key, file_format),
+        )
+        self._db.executemany(
+            "INSERT INTO deps VALUES (?, ?, ?)",
+            ((cursor.lastrowid, i, dep) for i, dep in enumerate(deps or ())),
+        )
+
+    def _get_key(self, path: str) -> StatKey | None:
+        row: StatKey | None = self._db.execute(
+            "SELECT dev, ino, size, mtime_ns FROM files WHERE path = ?",
+            (os.fsencode(path),),
+        ).fetchone()
+        return row
+
+    def _get_paths(self, root: str) -> set[str]:
+        encoded_root = os.fsencode(root)
+        prefix = os.path.join(encoded_root, b"")
+        # paths starting with prefix sort before prefix[:-1] + (sep + 1)
+        end = prefix[:-1] + bytes([prefix[-1] + 1])
+        cursor = self._db.execute(
+            "SELECT path FROM files WHERE path = ? OR (path >= ? AND path < ?)",
+            (encoded_root, prefix, end),
+        )
+        return {os.fsdecode(path) for (path,) in cursor}
+
+    def update(
+        self,
+        roots: Iterable[str],
+        recursive: bool,
+        jobs: int = 1,
+    ) -> None:
+        """
+        Index the files in roots, parsing only the new or changed ones,
+        and drop the entries of the files that no longer exist. Entries
+        under a directory are dropped only if it is walked recursively.
+        """
+        abs_roots = [os.path.abspath(root) for root in roots]
+        keys: dict[str, StatKey] = {}
+        seen = set()
+        for path in find_files(abs_roots, recursive):
+            seen.add(path)
+            try:
+                key = _stat_key(os.stat(path))
+            except OSError as e:
+                print(f"{path}: {e.strerror}", file=sys.stderr)
+                if isinstance(e, FileNotFoundError):
+                    self._delete(os.fsencode(path))
+                continue
+            if self._get_key(path) != key:
+                keys[path] = key
+        for path, file_format, deps in read_all_deps(keys, jobs, False):
+            self._put(path, keys[path], file_format, deps)
+        for root in abs_roots:
+            if not (recursive and os.path.isdir(root)):
+                continue
+            for path in self._get_paths(root) - seen:
+                self._delete(os.fsencode(path))
+
+    def _get_files(self, ids: Iterable[int]) -> Iterator[tuple[str, list[str]]]:
+        for file_id in ids:
+            (path,) = self._db.execute(
+                "SELECT path FROM files WHERE id = ?",
+                (file_id,),
+            ).fetchone()
+            deps = [
+                name
+                for (name,) in self._db.execute(
+                    "SELECT name FROM deps WHERE file_id = ? ORDER BY position",
+                    (file_id,),
+                )
+            ]
+            yield os.fsdecode(path), deps
+
+    def grep(
+        self,
+        include_re: re.Pattern[str],
+    ) -> Iterator[tuple[str, list[str]]]:
+        # match the pattern against the distinct library names only
+        names = [
+            name
+            for (name,) in self._db.execute("SELECT DISTINCT name FROM deps")
+            if include_re.search(name)
+        ]
+        ids: set[int] = set()
+        for name in names:
+            ids.update(
+                file_id
+                for (file_id,) in self._db.execute(
+                    "SELECT file_id FROM deps WHERE name = ?",
+                    (name,),
+                )
+            )
+        yield from sorted(self._get_files(ids))
+
+    def get_dependents(self, name: str) -> Iterator[str]:
+        ids = {
+            file_id
+            for (file_id,) in self._db.execute(
+                "SELECT file_id FROM deps WHERE name = ?",
+                (name,),
+            )
+        }
+        for path, _ in sorted(self._get_files(ids)):
+            yield path
+
 
+def _in_roots(path: str, roots: list[str]) -> bool:
+    return any(
+        path == root or path.startswith(os.path.join(root, ""))
+        for root in roots
+    )
 
-def main():
+
+def main() -> None:
     """
     Grep dependencies of executable files.
     """
     parser = argparse.ArgumentParser(description=main.__doc__)
     parser.add_argument("-p", "--pattern", default=".")
-    parser.add_argument("files", metavar="file", nargs="+")
+    parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="search the files contained in directories recursively",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="parse up to JOBS files in parallel",
+    )
+    parser.add_argument(
+        "-u",
+        "--unordered",
+        action="store_true",
+        help="print the matching files in completion order",
+    )
+    parser.add_argument(
+        "-i",
+        "--index",
+        metavar="DB",
+        help="update the dependency index DB with the given files and "
+        "answer the query from it",
+    )
+    parser.add_argument(
+        "-l",
+        "--dependents",
+        metavar="LIBRARY",
+        help="list the indexed files that depend on LIBRARY",
+    )
+    parser.add_argument(
+        "-c",
+        "--closure",
+        choices=loader.FORMATS,
+        help="match and print the transitive dependencies as a tree, a "
+        "list or a DOT graph",
+    )
+    parser.add_argument("files", metavar="file", nargs="*")
     args = parser.parse_args()
-    for name, deps in grep(args.files, re.compile(args.pattern)):
-        print(name, " ".join(deps))
+    if not args.index and (args.dependents or not args.files):
+        parser.error("the index is required to query without files")
+    if args.index and args.closure:
+        parser.error("the index cannot be used to compute closures")
+
+    include_re = re.compile(args.pattern)
+    if args.closure:
+        paths = find_files(args.files, args.recursive)
+        closures = grep_closures(paths, include_re)
+        if args.closure == "dot":
+            # a single graph, where shared libraries are merged
+            merged: loader.Graph = {}
+            for _, graph in closures:
+                merged.update(graph)
+            print("digraph deps {")
+            for line in loader.format_dot(merged):
+                print(line)
+            print("}")
+            return
+        output_format = loader.FORMATS[args.closure]
+        for root, graph in closures:
+            for line in output_format(graph, root):
+                print(line)
+        return
+
+    if not args.index:
+        paths = find_files(args.files, args.recursive)
+        ordered = not args.unordered
+        for name, deps in grep(paths, include_re, args.jobs, ordered):
+            print(name, " ".join(deps))
+        return
+
+    with DepIndex(args.index) as index:
+        index.update(args.files, args.recursive, args.jobs)
+        roots = [os.path.abspath(path) for path in args.files]
+        if args.dependents:
+            for name in index.get_dependents(args.dependents):
+                if not roots or _in_roots(name, roots):
+                    print(name)
+        else:
+            for name, deps in index.grep(include_re):
+                if not roots or _in_roots(name, roots):
+                    print(name, " ".join(deps))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import glob
+import json
+import os
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional
+
+from . import elf, macho
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+DEFAULT_DIRS = ("/lib64", "/usr/lib64", "/lib", "/usr/lib")
+
+# the (name, path) pairs of the dependencies of each binary, where path is
+# None if the dependency could not be resolved
+Graph = dict[str, list[tuple[str, Optional[str]]]]
+
+
+def read_ld_so_conf(path: str) -> list[str]:
+    dirs: list[str] = []
+    try:
+        f = open(path)
+    except OSError:
+        return dirs
+    with f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line or line.startswith("hwcap"):
+                continue
+            if line.startswith("include"):
+                pattern = line[len("include") :].strip()
+                pattern = os.path.join(os.path.dirname(path), pattern)
+                for conf_path in sorted(glob.glob(pattern)):
+                    dirs.extend(read_ld_so_conf(conf_path))
+            else:
+                dirs.append(line)
+    return dirs
+
+
+@dataclass
+class Binary:
+    path: str
+    format: str
+    deps: list[str]
+    rpath: list[str] = field(default_factory=list)
+    runpath: list[str] = field(default_factory=list)
+    machine: int | None = None
+    elf_class: int | None = None
+
+
+def load_binary(path: str) -> Binary | None:
+    with open(path, "rb") as f:
+        try:
+            elf_info = elf.ELFInfo(f)
+        except ValueError:
+            pass
+        else:
+            return Binary(
+                path,
+                "elf",
+                [dep for dep in elf_info.get_deps() if dep is not None],
+                elf_info.get_rpath(),
+                elf_info.get_runpath(),
+                elf_info.machine,
+                elf_info.elf_class,
+            )
+        try:
+            macho_info = macho.MachOInfo(f)
+        except ValueError:
+            return None
+        return Binary(
+            path,
+            "macho",
+            list(macho_info.get_deps()),
+            list(macho_info.get_rpaths()),
+        )
+
+
+class Resolver:
+    """
+    Resolve the dependencies of executable files to paths, following the
+    search rules of the ELF dynamic loader and of dyld. Parsed files and
+    resolved names are cached, so each library is parsed once across all
+    the closures computed by the same resolver.
+    """
+
+    def __init__(
+        self,
+        ld_so_conf: str = "/etc/ld.so.conf",
+        ld_library_path: str | None = None,
+    ) -> None:
+        if ld_library_path is None:
+            ld_library_path = os.environ.get("LD_LIBRARY_PATH", "")
+        self._env_dirs = [d for d in ld_library_path.split(":") if d]
+        self._system_dirs = [*read_ld_so_conf(ld_so_conf), *DEFAULT_DIRS]
+        self._binaries: dict[str, Binary | None] = {}
+        self._found: dict[
+            tuple[tuple[str, ...], int | None, int | None], str | None
+        ] = {}
+
+    def load(self, path: str) -> Binary | None:
+        path = os.path.realpath(path)
+        if path not in self._binaries:
+            try:
+                self._binaries[path] = load_binary(path)
+            except OSError:
+                self._binaries[path] = None
+        return self._binaries[path]
+
+    def _find(self, candidates: list[str], binary: Binary) -> str | None:
+        key = (tuple(candidates), binary.machine, binary.elf_class)
+        if key not in self._found:
+            self._found[key] = None
+            for candidate in candidates:
+                if not os.path.isfile(candidate):
+                    continue
+                dep = self.load(candidate)
+                # the ELF loader skips libraries of another architecture
+                if dep and (dep.machine, dep.elf_class) == key[1:]:
+                    self._found[key] = dep.path
+                    break
+        return self._found[key]
+
+    def _expand_origin(self, dirs: list[str], binary: Binary) -> list[str]:
+        origin = os.path.dirname(binary.path)
+        return [
+            d.replace("${ORIGIN}", origin).replace("$ORIGIN", origin)
+            for d in dirs
+        ]
+
+    def _resolve_elf(
+        self,
+        name: str,
+        binary: Binary,
+        root: Binary,
+    ) -> str | None:
+        if "/" in name:
+            return self._find([name], binary)
+        dirs: list[str] = []
+        if not binary.runpath:
+            dirs.extend(self._expand_origin(binary.rpath, binary))
+            if root is not binary:
+                dirs.extend(self._expand_origin(root.rpath, root))
+        dirs.extend(self._env_dirs)
+        dirs.extend(self._expand_origin(binary.runpath, binary))
+        dirs.extend(self._system_dirs)
+        return self._find([os.path.join(d, name) for d in dirs], binary)
+
+    def _expand_macho(self, name: str, binary: Binary, root: Binary) -> str:
+        for prefix, path in (
+            ("@loader_path/", binary.path),
+            ("@executable_path/", root.path),
+        ):
+            if name.startswith(prefix):
+                return os.path.join(
+                    os.path.dirname(path),
+                    name[len(prefix) :],
+                )
+        return name
+
+    def _resolve_macho(
+        self,
+        name: str,
+        binary: Binary,
+        root: Binary,
+    ) -> str | None:
+        if name.startswith("@rpath/"):
+            rpaths = list(binary.rpath)
+            if root is not binary:
+                rpaths.extend(root.rpath)
+            candidates = [
+                os.path.join(
+                    self._expand_macho(rpath, binary, root),
+                    name[len("@rpath/") :],
+                )
+                for rpath in rpaths
+            ]
+        else:
+            candidates = [self._expand_macho(name, binary, root)]
+        return self._find(candidates, binary)
+
+    def resolve(self, name: str, binary: Binary, root: Binary) -> str | None:
+        if binary.format == "elf":
+            return self._resolve_elf(name, binary, root)
+        return self._resolve_macho(name, binary, root)
+
+    def get_closure(self, path: str) -> Graph | None:
+        """
+        Return the dependency graph of an executable file, as a dictionary
+        mapping the path of each binary to a list of (name, path) pairs,
+        where path is None if the dependency could not be resolved. The
+        file itself is the first key.
+        """
+        root = self.load(path)
+        if root is None:
+            return None
+        graph: Graph = {}
+        stack = [root]
+        while stack:
+            binary = stack.pop()
+            if binary.path in graph:
+                continue
+            edges: list[tuple[str, str | None]] = []
+            for name in binary.deps:
+                dep_path = self.resolve(name, binary, root)
+                edges.append((name, dep_path))
+                if dep_path is not None and dep_path not in graph:
+                    dep = self.load(dep_path)
+                    if dep is not None:
+                        stack.append(dep)
+            graph[binary.path] = edges
+        return graph
+
+
+def _format_edge(name: str, dep: str | None) -> str:
+    return f"{name} => {dep or 'not found'}"
+
+
+def format_tree(graph: Graph, root: str) -> list[str]:
+    lines = [root]
+    # the dependencies of each library are listed only once
+    visited = {root}
+
+    def visit(path: str, depth: int) -> None:
+        for name, dep in graph[path]:
+            lines.append("  " * depth + _format_edge(name, dep))
+            if dep is not None and dep not in visited:
+                visited.add(dep)
+                visit(dep, depth + 1)
+
+    visit(root, 1)
+    return lines
+
+
+def format_list(graph: Graph, root: str) -> list[str]:
+    edges = {edge for edges in graph.values() for edge in edges}
+    return [
+        root,
+        *(
+            "  " + _format_edge(name, dep)
+            for name, dep in sorted(edges, key=lambda e: (e[0], e[1] or ""))
+        ),
+    ]
+
+
+def format_dot(graph: Graph, root: str | None = None) -> list[str]:
+    return [
+        f"    {json.dumps(path)} -> {json.dumps(dep or name)};"
+        for path, edges in graph.items()
+        for name, dep in edges
+    ]
+
+
+FORMATS: dict[str, Callable[[Graph, str], list[str]]] = {
+    "tree": format_tree,
+    "list": format_list,
+    "dot": format_dot,
+}
@@ -1,8 +1,61 @@
 from __future__ import annotations
 
 import struct
-from ctypes import BigEndianStructure, LittleEndianStructure, c_uint32, sizeof
+from ctypes import (
+    BigEndianStructure,
+    LittleEndianStructure,
+    Structure,
+    c_uint32,
+    c_uint64,
+    sizeof,
+)
 from dataclasses import dataclass
+from typing import TYPE_CHECKING, TypeVar
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from io import BufferedReader
+
+LC_LOAD_DYLIB = 0xC
+LC_LOAD_WEAK_DYLIB = 0x80000018
+LC_RPATH = 0x8000001C
+LC_REEXPORT_DYLIB = 0x8000001F
+LC_LAZY_LOAD_DYLIB = 0x20
+LC_LOAD_UPWARD_DYLIB = 0x80000023
+
+DYLIB_COMMANDS = (
+    LC_LOAD_DYLIB,
+    LC_LOAD_WEAK_DYLIB,
+    LC_REEXPORT_DYLIB,
+    LC_LAZY_LOAD_DYLIB,
+    LC_LOAD_UPWARD_DYLIB,
+)
+
+
+class fat_header(BigEndianStructure):
+    _fields_ = (("magic", c_uint32), ("nfat_arch", c_uint32))
+
+
+class fat_arch(BigEndianStructure):
+    _fields_ = (
+        ("cputype", c_uint32),
+        ("cpusubtype", c_uint32),
+        ("offset", c_uint32),
+        ("size", c_uint32),
+        ("align", c_uint32),
+    )
+
+
+class fat_arch_64(BigEndianStructure):
+    _fields_ = (
+        ("cputype", c_uint32),
+        ("cpusubtype", c_uint32),
+        ("offset", c_uint64),
+        ("size", c_uint64),
+        ("align", c_uint32),
+        ("reserved", c_uint32),
+    )
+
 
 _mach_header_fields = (
     ("magic", c_uint32),
@@ -12,7 +65,6 @@ _mach_header_fields = (
     ("ncmds", c_uint32),
     ("sizeofcmds", c_uint32),
     ("flags", c_uint32),
-    ("pad", c_uint32),
 )
 
 
@@ -24,6 +76,14 @@ class mach_header_be(BigEndianStructure):
     _fields_ = _mach_header_fields
 
 
+class mach_header_64_le(LittleEndianStructure):
+    _fields_ = (*_mach_header_fields, ("reserved", c_uint32))
+
+
+class mach_header_64_be(BigEndianStructure):
+    _fields_ = (*_mach_header_fields, ("reserved", c_uint32))
+
+
 class load_command_le(LittleEndianStructure):
     _pack_ = 1
     _fields_ = (("cmd", c_uint32), ("cmdsize", c_uint32))
@@ -52,57 +112,157 @@ class dylib_be(BigEndianStructure):
     _fields_ = _dylib_fields
 
 
-def read_struct(stream, stype):
+class rpath_le(LittleEndianStructure):
+    _pack_ = 1
+    _fields_ = (("path", c_uint32),)
+
+
+class rpath_be(BigEndianStructure):
+    _pack_ = 1
+    _fields_ = (("path", c_uint32),)
+
+
+S = TypeVar("S", bound=Structure)
+
+
+def read_struct(stream: BufferedReader, stype: type[S]) -> S | None:
     data = stream.read(sizeof(stype))
     if len(data) < sizeof(stype):
         return None
     return stype.from_buffer_copy(data)
 
 
+def _get_string(data: bytes, start: int, end: int) -> str:
+    string = data[start:end]
+    end_index = string.find(b"\x00")
+    if end_index >= 0:
+        string = string[:end_index]
+    return string.decode("latin-1")
+
+
 @dataclass
 class Layout:
-    load_command: LittleEndianStructure | BigEndianStructure
-    dylib: LittleEndianStructure | BigEndianStructure
+    header: type[Structure]
+    load_command: type[Structure]
+    dylib: type[Structure]
+    rpath: type[Structure]
+
+
+_LAYOUTS = {
+    0xFEEDFACE: Layout(mach_header_le, load_command_le, dylib_le, rpath_le),
+    0xCEFAEDFE: Layout(mach_header_be, load_command_be, dylib_be, rpath_be),
+    0xFEEDFACF: Layout(mach_header_64_le, load_command_le, dylib_le, rpath_le),
+    0xCFFAEDFE: Layout(mach_header_64_be, load_command_be, dylib_be, rpath_be),
+}
+
+
+@dataclass
+class Slice:
+    offset: int
+    header: Structure
+    layout: Layout
 
 
 class MachOInfo:
-    def __init__(self, stream):
+    def __init__(self, stream: BufferedReader) -> None:
         self._stream = stream
-        self._header = None
+        self.slices: list[Slice] = []
         self._read_header()
-        if not self._header:
+        if not self.slices:
             raise ValueError
 
-    def _read_header(self):
-        self._stream.seek(0)
-        data = self._stream.peek(4)
+    def _read_slice(self, offset: int) -> Slice | None:
+        self._stream.seek(offset)
+        data = self._stream.read(4)
         if len(data) < 4:
-            return
-        magic = struct.unpack("I", data[:4])[0]
-        if magic == 0xFEEDFACF:
-            self._header = read_struct(self._stream, mach_header_le)
-            self._layout = Layout(load_command_le, dylib_le)
-        elif magic == 0xCFFAEDFE:
-            self._header = read_struct(self._stream, mach_header_be)
-            self._layout = Layout(load_command_be, dylib_be)
-
-    def get_deps(self):
-        self._stream.seek(sizeof(self._header))
-        for _ in range(self._header.ncmds):
-            lc = read_struct(self._stream, self._layout.load_command)
-            if not lc:
+            return None
+        layout = _LAYOUTS.get(struct.unpack("<I", data)[0])
+        if layout is None:
+            return None
+        self._stream.seek(offset)
+        header = read_struct(self._stream, layout.header)
+        if not header:
+            return None
+        return Slice(offset, header, layout)
+
+    def _read_header(self) -> None:
+        self._stream.seek(0)
+        header = read_struct(self._stream, fat_header)
+        if header and header.magic in (0xCAFEBABE, 0xCAFEBABF):
+            # Java class files share the magic number of fat binaries, but
+            # their version makes for an implausible number of slices
+            if header.nfat_arch > 20:
                 return
-            if lc.cmd == 0xC:
-                dylib = read_struct(self._stream, self._layout.dylib)
-                if not dylib:
+            arch_type = fat_arch if header.magic == 0xCAFEBABE else fat_arch_64
+            offsets = []
+            for _ in range(header.nfat_arch):
+                arch = read_struct(self._stream, arch_type)
+                if not arch:
+                    return
+                offsets.append(arch.offset)
+            for offset in offsets:
+                mach_slice = self._read_slice(offset)
+                if not mach_slice:
+                    self.slices = []
                     return
-                size = lc.cmdsize - sizeof(lc) - sizeof(dylib)
-                name = self._stream.read(size)
-                if len(name) < size:
+                self.slices.append(mach_slice)
+        else:
+            mach_slice = self._read_slice(0)
+            if mach_slice:
+                self.slices.append(mach_slice)
+
+    def _get_commands(
+        self,
+        mach_slice: Slice,
+    ) -> Iterator[tuple[Structure, bytes]]:
+        """
+        Yield the load commands of a slice, with their data, read in a
+        single buffer.
+        """
+        layout = mach_slice.layout
+        self._stream.seek(mach_slice.offset + sizeof(layout.header))
+        size = mach_slice.header.sizeofcmds
+        data = self._stream.read(size)
+        offset = 0
+        for _ in range(mach_slice.header.ncmds):
+            if offset + sizeof(layout.load_command) > len(data):
+                return
+            lc = layout.load_command.from_buffer_copy(data, offset)
+            if lc.cmdsize < sizeof(lc) or offset + lc.cmdsize > len(data):
+                return
+            yield lc, data[offset : offset + lc.cmdsize]
+            offset += lc.cmdsize
+
+    def _get_slice_deps(self, mach_slice: Slice) -> Iterator[str]:
+        dylib_type = mach_slice.layout.dylib
+        for lc, data in self._get_commands(mach_slice):
+            if lc.cmd in DYLIB_COMMANDS:
+                if len(data) < sizeof(lc) + sizeof(dylib_type):
                     return
-                end_index = name.find(b"\x00")
-                if end_index >= 0:
-                    name = name[:end_index]
-                yield name.decode("latin-1")
-            else:
-                self._stream.seek(lc.cmdsize - sizeof(lc), 1)
+                dylib = dylib_type.from_buffer_copy(data, sizeof(lc))
+                yield _get_string(data, dylib.name, len(data))
+
+    def _get_slice_rpaths(self, mach_slice: Slice) -> Iterator[str]:
+        rpath_type = mach_slice.layout.rpath
+        for lc, data in self._get_commands(mach_slice):
+            if lc.cmd == LC_RPATH:
+                if len(data) < sizeof(lc) + sizeof(rpath_type):
+                    return
+                rpath = rpath_type.from_buffer_copy(data, sizeof(lc))
+                yield _get_string(data, rpath.path, len(data))
+
+    def get_archs(self) -> list[tuple[int, int]]:
+        return [(s.header.cputype, s.header.cpusubtype) for s in self.slices]
+
+    def get_deps(self) -> Iterator[str]:
+        # the union of the dependencies of all the slices
+        deps: dict[str, None] = {}
+        for mach_slice in self.slices:
+            deps.update(dict.fromkeys(self._get_slice_deps(mach_slice)))
+        yield from deps
+
+    def get_rpaths(self) -> Iterator[str]:
+        rpaths: dict[str, None] = {}
+        for mach_slice in self.slices:
+            rpaths.update(dict.fromkeys(self._get_slice_rpaths(mach_slice)))
+        yield from rpaths
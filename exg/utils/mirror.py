@@ -3,14 +3,505 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
+import heapq
 import json
 import os
 import re
+import shlex
+import sqlite3
+import stat
+import struct
+import sys
 import tempfile
+import time
 import urllib.parse
-from dataclasses import dataclass
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from functools import cached_property
-from subprocess import PIPE, Popen, run
+from subprocess import PIPE, CalledProcessError, Popen, run
+from typing import IO, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from types import TracebackType
+
+    from . import filehash
+
+IGNORE_NAME = ".ignore"
+INDEX_NAME = ".ino-index.sqlite3"
+# index written by previous versions, read if INDEX_NAME is missing
+JSON_INDEX_NAME = ".ino-index.json"
+# first argument of the remote helper, see serve
+SERVE_ARG = "--serve"
+# weight of a file in bytes when balancing rsync processes, see --jobs
+FILE_WEIGHT = 1 << 12
+_SIZE = struct.Struct("<Q")
+_RECORD = struct.Struct("<QI")
+_WILDCARD_RE = re.compile(r"\*\*|\*|\?|\[!?\]?[^]]*\]|\\.")
+# rsync options selecting the transferred files that scan_tree does not
+# follow, see Rsync._filtered
+_FILTER_OPTIONS = (
+    "--cvs-exclude",
+    "--exclude-from",
+    "--files-from",
+    "--filter",
+    "--include",
+    "--include-from",
+    "--max-size",
+    "--min-size",
+    "--one-file-system",
+)
+_SHORT_FILTER_OPTIONS = "CFfx"
+
+
+def _translate(pattern: str) -> str:
+    """
+    Translate an rsync wildcard pattern to a regular expression.
+    """
+    regex = []
+    pos = 0
+    for match in _WILDCARD_RE.finditer(pattern):
+        regex.append(re.escape(pattern[pos : match.start()]))
+        token = match.group()
+        if token == "**":
+            regex.append(".*")
+        elif token == "*":
+            regex.append("[^/]*")
+        elif token == "?":
+            regex.append("[^/]")
+        elif token.startswith("\\"):
+            regex.append(re.escape(token[1]))
+        else:
+            body = token[1:-1].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            regex.append(f"[{body}]")
+        pos = match.end()
+    regex.append(re.escape(pattern[pos:]))
+    return "".join(regex)
+
+
+@dataclass(frozen=True)
+class _Rule:
+    """
+    An exclude pattern, matched against paths relative to the root of the
+    tree. Anchored patterns are relative to the directory of the file that
+    defines them.
+    """
+
+    regex: str
+    dir_only: bool
+
+    @classmethod
+    def parse(cls, pattern: str, base: str = "") -> _Rule:
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        if pattern.startswith("/"):
+            prefix = re.escape(os.path.join(base, "")) if base else ""
+            pattern = pattern.lstrip("/")
+        else:
+            prefix = "(?:.*/)?"
+        return cls(prefix + _translate(pattern), dir_only)
+
+
+def _compile(rules: Iterable[_Rule]) -> re.Pattern[str] | None:
+    regexes = [f"(?:{rule.regex})" for rule in rules]
+    return re.compile("|".join(regexes)) if regexes else None
+
+
+def _read_ignore_file(path: str, base: str) -> list[_Rule]:
+    try:
+        with open(path, encoding="utf-8", errors="surrogateescape") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    return [
+        _Rule.parse(line, base)
+        for line in lines
+        if line and not line.startswith(("#", ";"))
+    ]
+
+
+def scan_tree(root: str, excludes: Iterable[str] = ()) -> dict[int, str]:
+    """
+    Map the inode of each regular file in a tree to its path relative to
+    the root, skipping the files excluded by the given patterns or by the
+    .ignore files, like rsync --filter="dir-merge,- .ignore". Inodes are
+    read from the directory entries, without calling stat.
+    """
+    index = {}
+    stack = [("", [_Rule.parse(pattern) for pattern in excludes])]
+    while stack:
+        rel_dir, rules = stack.pop()
+        dir_path = os.path.join(root, rel_dir)
+        rules = rules + _read_ignore_file(
+            os.path.join(dir_path, IGNORE_NAME),
+            rel_dir,
+        )
+        file_re = _compile(rule for rule in rules if not rule.dir_only)
+        dir_re = _compile(rules)
+        try:
+            it = os.scandir(dir_path)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                rel_path = os.path.join(rel_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    if not (dir_re and dir_re.fullmatch(rel_path)):
+                        stack.append((rel_path, rules))
+                elif entry.is_file(follow_symlinks=False):
+                    if not (file_re and file_re.fullmatch(rel_path)):
+                        index[entry.inode()] = rel_path
+    return index
+
+
+class InodeIndex:
+    """
+    Index of the regular files of the source tree at the time of the last
+    sync, keyed by inode and stored in the destination directory. Only the
+    entries that changed are written.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files "
+            "(ino INTEGER PRIMARY KEY, path BLOB)"
+        )
+
+    def __enter__(self) -> InodeIndex:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self._db.commit()
+        self._db.close()
+
+    def load(self) -> dict[int, str]:
+        return {
+            ino: os.fsdecode(path)
+            for ino, path in self._db.execute("SELECT ino, path FROM files")
+        }
+
+    def update(self, old: dict[int, str], new: dict[int, str]) -> None:
+        self._db.executemany(
+            "DELETE FROM files WHERE ino = ?",
+            ((ino,) for ino in old.keys() - new.keys()),
+        )
+        self._db.executemany(
+            "INSERT OR REPLACE INTO files VALUES (?, ?)",
+            (
+                (ino, os.fsencode(path))
+                for ino, path in new.items()
+                if old.get(ino) != path
+            ),
+        )
+
+
+class ContentMatcher:
+    """
+    Find files of a source tree with a copy in a destination tree, that is
+    a file with the same content and, like rsync --modify-window=1, the
+    same modification time up to one second. Hashes are computed on
+    demand, at most once per file.
+    """
+
+    def __init__(
+        self,
+        src_root: str,
+        dest_root: str,
+        cache: filehash.HashCache | None = None,
+    ) -> None:
+        self._src_root = src_root
+        self._dest_root = dest_root
+        self._cache = cache
+        self._stats: dict[str, os.stat_result | None] = {}
+        self._hashes: dict[str, tuple[str | None, str | None]] = {}
+
+    def _stat(self, path: str) -> os.stat_result | None:
+        if path not in self._stats:
+            try:
+                st: os.stat_result | None = os.lstat(path)
+            except OSError:
+                st = None
+            # empty files are not worth linking
+            if st and not (stat.S_ISREG(st.st_mode) and st.st_size > 0):
+                st = None
+            self._stats[path] = st
+        return self._stats[path]
+
+    def _hash(self, path: str, full: bool) -> str:
+        from . import filehash
+
+        st = self._stat(path)
+        assert st is not None
+        if path not in self._hashes:
+            cached = self._cache.get(st) if self._cache else (None, None)
+            self._hashes[path] = cached
+        sample, digest = self._hashes[path]
+        if sample is None:
+            with open(path, "rb") as f:
+                sample = filehash.hash_sample(f, 0, st.st_size)
+        if st.st_size <= 2 * filehash.SAMPLE_SIZE:
+            # the sample covers the whole file
+            digest = sample
+        elif full and digest is None:
+            digest = filehash.hash_file(path)
+        if (sample, digest) != self._hashes[path]:
+            self._hashes[path] = (sample, digest)
+            if self._cache:
+                self._cache.put(path, st, sample, digest)
+        return digest if full and digest else sample
+
+    def is_copy(self, src_path: str, dest_path: str, full: bool) -> bool:
+        """
+        Tell whether the destination file is a copy of the source file,
+        comparing only the hashes of their head and tail unless full.
+        """
+        src = os.path.join(self._src_root, src_path)
+        dest = os.path.join(self._dest_root, dest_path)
+        src_st = self._stat(src)
+        dest_st = self._stat(dest)
+        if not (
+            src_st
+            and dest_st
+            and src_st.st_size == dest_st.st_size
+            and abs(src_st.st_mtime - dest_st.st_mtime) <= 1
+        ):
+            return False
+        if self._hash(src, False) != self._hash(dest, False):
+            return False
+        return not full or self._hash(src, True) == self._hash(dest, True)
+
+    def match(
+        self,
+        src_paths: Iterable[str],
+        dest_paths: Iterable[str],
+    ) -> dict[str, str]:
+        """
+        Return a dictionary mapping the relative path of each source file
+        with a copy among the destination files to the path of the copy.
+        Files are grouped by size, then by the hash of their head and tail,
+        and only the remaining candidates are fully hashed.
+        """
+        by_size = defaultdict(list)
+        for dest_path in dest_paths:
+            st = self._stat(os.path.join(self._dest_root, dest_path))
+            if st:
+                by_size[st.st_size].append(dest_path)
+
+        matches = {}
+        for src_path in src_paths:
+            st = self._stat(os.path.join(self._src_root, src_path))
+            if not st:
+                continue
+            candidates = by_size.get(st.st_size, [])
+            for full in (False, True):
+                candidates = [
+                    dest_path
+                    for dest_path in candidates
+                    if self.is_copy(src_path, dest_path, full)
+                ]
+            if candidates:
+                matches[src_path] = candidates[0]
+        return matches
+
+
+@dataclass
+class Stats:
+    """
+    Statistics of a sync: the number of files in the source index, the
+    number of renamed files, their total size and the time spent in each
+    phase.
+    """
+
+    files: int = 0
+    renames: int = 0
+    linked_bytes: int = 0
+    times: dict[str, float] = field(default_factory=dict)
+
+    @contextlib.contextmanager
+    def time(self, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.times[phase] = self.times.get(phase, 0) + elapsed
+
+    def format(self) -> list[str]:
+        return [
+            f"files indexed: {self.files}",
+            f"renames detected: {self.renames}",
+            f"bytes linked: {self.linked_bytes}",
+            *(
+                f"time {phase}: {elapsed:.3f}s"
+                for phase, elapsed in self.times.items()
+            ),
+        ]
+
+
+def load_dest_index(dest: str) -> dict[int, str]:
+    path = os.path.join(dest, INDEX_NAME)
+    if os.path.isfile(path):
+        with InodeIndex(path) as index:
+            return index.load()
+    path = os.path.join(dest, JSON_INDEX_NAME)
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            return {
+                int(ino): rel_path for ino, rel_path in json.load(f).items()
+            }
+    return {}
+
+
+def update_dest_index(
+    dest: str,
+    dest_index: dict[int, str],
+    src_index: dict[int, str],
+) -> None:
+    path = os.path.join(dest, INDEX_NAME)
+    if not os.path.isfile(path):
+        # dest_index may come from the JSON index
+        dest_index = {}
+    with InodeIndex(path) as index:
+        index.update(dest_index, src_index)
+
+
+def find_renames(
+    src_index: dict[int, str],
+    dest_index: dict[int, str],
+) -> dict[str, str]:
+    """
+    Map the relative path of each source file whose inode is in the
+    destination index under another path to that path.
+    """
+    return {
+        src_index[ino]: dest_index[ino]
+        for ino in dest_index.keys() & src_index.keys()
+        if dest_index[ino] != src_index[ino]
+    }
+
+
+def _link_files(
+    link_dir: bytes,
+    links: list[tuple[bytes, bytes]],
+) -> int:
+    fd = os.open(link_dir, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        size = 0
+        for src, name in links:
+            # the copy in the destination may have been removed or replaced
+            try:
+                st = os.lstat(src)
+            except FileNotFoundError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            os.link(src, name, dst_dir_fd=fd)
+            size += st.st_size
+        return size
+    finally:
+        os.close(fd)
+
+
+def create_link_dest_dir(
+    dest: str,
+    renames: dict[str, str],
+) -> tuple[tempfile.TemporaryDirectory[str], int]:
+    """
+    Create a directory for rsync --link-dest next to the destination,
+    with a hard link to the current copy of each renamed file at its new
+    path. The links are grouped by directory, each directory is created
+    once and the directories are filled by a thread pool. Return the
+    directory and the total size of the linked files.
+    """
+    tempdir = tempfile.TemporaryDirectory(dir=os.path.dirname(dest))
+    root = os.fsencode(tempdir.name)
+    dest_root = os.fsencode(dest)
+    by_dir = defaultdict(list)
+    for src_path, dest_path in renames.items():
+        link_dir, name = os.path.split(os.fsencode(src_path))
+        src = os.path.join(dest_root, os.fsencode(dest_path))
+        by_dir[os.path.join(root, link_dir)].append((src, name))
+    for link_dir in by_dir:
+        os.makedirs(link_dir, exist_ok=True)
+    with ThreadPoolExecutor() as executor:
+        size = sum(executor.map(_link_files, by_dir, by_dir.values()))
+    return tempdir, size
+
+
+def write_index(f: IO[bytes], index: dict[int, str]) -> None:
+    """
+    Write an index as a zlib-compressed sequence of (inode, path length,
+    path) records, preceded by its compressed size.
+    """
+    records = []
+    for ino, path in index.items():
+        data = os.fsencode(path)
+        records.append(_RECORD.pack(ino, len(data)))
+        records.append(data)
+    data = zlib.compress(b"".join(records))
+    f.write(_SIZE.pack(len(data)))
+    f.write(data)
+    f.flush()
+
+
+def read_index(f: IO[bytes]) -> dict[int, str]:
+    header = f.read(_SIZE.size)
+    if len(header) < _SIZE.size:
+        raise EOFError("truncated index")
+    (size,) = _SIZE.unpack(header)
+    data = zlib.decompress(f.read(size))
+    index = {}
+    pos = 0
+    while pos < len(data):
+        ino, length = _RECORD.unpack_from(data, pos)
+        pos += _RECORD.size
+        index[ino] = os.fsdecode(data[pos : pos + length])
+        pos += length
+    return index
+
+
+def serve(args: list[str]) -> None:
+    """
+    Run the remote side of a sync, started over rsh by mirror itself.
+    "scan PATH [EXCLUDE...]" writes the index of the source tree PATH.
+    "stage PATH" reads the index of the source tree, creates a link-dest
+    directory for the renamed files in the destination PATH and writes
+    its path and statistics as JSON, then updates the destination index
+    if "commit" is read.
+    The link-dest directory is removed in both cases.
+    """
+    mode, path, *excludes = args
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    if mode == "scan":
+        write_index(stdout, scan_tree(path, excludes))
+        return
+
+    stats = Stats()
+    src_index = read_index(stdin)
+    with stats.time("load index"):
+        dest_index = load_dest_index(path)
+    renames = find_renames(src_index, dest_index)
+    with stats.time("link"):
+        tempdir, stats.linked_bytes = create_link_dest_dir(path, renames)
+    stats.renames = len(renames)
+    with tempdir as link_dest:
+        reply = {"link_dest": os.path.abspath(link_dest), **asdict(stats)}
+        stdout.write(json.dumps(reply).encode() + b"\n")
+        stdout.flush()
+        if stdin.readline() == b"commit\n":
+            update_dest_index(path, dest_index, src_index)
 
 
 @dataclass
@@ -29,6 +520,10 @@ class Rsync:
     args: list[str]
     src: Address
     dest: Address
+    match_content: bool = False
+    cache_path: str | None = None
+    stats: Stats = field(default_factory=Stats)
+    jobs: int = 1
 
     def __post_init__(self) -> None:
         self.args = [
@@ -36,7 +531,8 @@ class Rsync:
             "--archive",
             "--delete",
             "--exclude=.DS_Store",
-            "--filter=dir-merge,- .ignore",
+            f"--exclude=/{INDEX_NAME}",
+            f"--filter=dir-merge,- {IGNORE_NAME}",
             "--human-readable",
             "--modify-window=1",
             "--no-group",
@@ -57,80 +553,312 @@ class Rsync:
                 self.dest.path = name
 
     @cached_property
-    def _dest_index_path(self) -> bytes:
-        return os.fsencode(os.path.join(self.dest.path, ".ino-index.json"))
+    def _excludes(self) -> list[str]:
+        excludes = []
+        it = iter(self.args)
+        for arg in it:
+            if arg == "--exclude":
+                excludes.append(next(it, ""))
+            elif arg.startswith("--exclude="):
+                excludes.append(arg[len("--exclude=") :])
+        return excludes
 
-    def _create_index(self) -> dict[str, str]:
-        tempdir = tempfile.TemporaryDirectory()
-        cmd = [
-            *self.args,
-            "-8",
-            "-n",
-            r"--out-format=%n",
-            self.src.path,
-            tempdir.name,
-        ]
-        index = {}
+    @cached_property
+    def _filtered(self) -> bool:
+        """
+        Return whether the files are also selected by rsync options that
+        scan_tree does not follow, such as --include or --max-size.
+        """
+        it = iter(self.args)
+        for arg in it:
+            if arg in ("-e", "--rsh"):
+                next(it, None)
+            elif arg == f"--filter=dir-merge,- {IGNORE_NAME}":
+                continue
+            elif arg.startswith("--"):
+                if arg.split("=", 1)[0] in _FILTER_OPTIONS:
+                    return True
+            elif arg.startswith("-"):
+                # the value of -e may follow in the same argument
+                flags = arg[1:].split("e", 1)[0]
+                if any(flag in _SHORT_FILTER_OPTIONS for flag in flags):
+                    return True
+        return False
+
+    def _list_files(self) -> set[str]:
+        """
+        Return the relative paths that rsync would transfer to an empty
+        directory.
+        """
+        args = [arg for arg in self.args if arg != "--progress"]
+        with tempfile.TemporaryDirectory() as tempdir:
+            cmd = [
+                *args,
+                "-8",
+                "-n",
+                "--out-format=%n",
+                self.src.serialize(),
+                tempdir,
+            ]
+            output = run(cmd, stdout=PIPE, check=True).stdout
+        return {os.fsdecode(line) for line in output.splitlines()}
+
+    def _find_renames(
+        self,
+        src_index: dict[int, str],
+        dest_index: dict[int, str],
+    ) -> dict[str, str]:
+        """
+        Map the relative path of each renamed source file to the path of a
+        copy in the destination, by inode and optionally by content.
+        """
+        renames = find_renames(src_index, dest_index)
+        # the content of a remote source cannot be hashed
+        if self.match_content and not self.src.host:
+            src_paths = set(src_index.values())
+            dest_paths = set(dest_index.values())
+            from . import filehash
+
+            with contextlib.ExitStack() as stack:
+                cache = None
+                if self.cache_path:
+                    cache = stack.enter_context(
+                        filehash.HashCache(self.cache_path)
+                    )
+                matcher = ContentMatcher(self.src.path, self.dest.path, cache)
+                # inodes may have been reused by other files
+                renames = {
+                    src_path: dest_path
+                    for src_path, dest_path in renames.items()
+                    if matcher.is_copy(src_path, dest_path, False)
+                }
+                renames.update(
+                    matcher.match(
+                        src_paths - dest_paths - renames.keys(),
+                        dest_paths - src_paths,
+                    )
+                )
+        return renames
+
+    @cached_property
+    def _rsh(self) -> list[str]:
+        rsh = os.environ.get("RSYNC_RSH", "ssh")
+        for i, arg in enumerate(self.args):
+            if arg in ("-e", "--rsh") and i + 1 < len(self.args):
+                rsh = self.args[i + 1]
+            elif arg.startswith("--rsh="):
+                rsh = arg[len("--rsh=") :]
+        return shlex.split(rsh)
+
+    def _serve_cmd(self, address: Address, *args: str) -> list[str]:
+        """
+        Return the command running serve on the host of address, passing
+        the source of this module to the remote Python interpreter, so that
+        it does not need to be installed there.
+        """
+        with open(__file__, encoding="utf-8") as f:
+            source = f.read()
+        cmd = ["python3", "-c", source, SERVE_ARG, *args]
+        assert address.host is not None
+        return [*self._rsh, address.host, shlex.join(cmd)]
+
+    def _scan(self) -> dict[int, str]:
+        with self.stats.time("scan"):
+            if self.src.host:
+                index = self._scan_remote()
+            else:
+                index = scan_tree(self.src.path, self._excludes)
+            if self._filtered:
+                # keep only the files that rsync transfers, which are the
+                # ones found in the destination by the next sync
+                paths = self._list_files()
+                index = {
+                    ino: rel_path
+                    for ino, rel_path in index.items()
+                    if rel_path in paths
+                }
+        self.stats.files = len(index)
+        return index
+
+    def _scan_remote(self) -> dict[int, str]:
+        cmd = self._serve_cmd(self.src, "scan", self.src.path, *self._excludes)
         with Popen(cmd, stdout=PIPE) as p:
             assert p.stdout is not None
-            for line in p.stdout:
-                rel_path = os.fsdecode(line.rstrip())
-                path = os.fsencode(os.path.join(self.src.path, rel_path))
-                if os.path.isfile(path):
-                    ino = os.lstat(path).st_ino
-                    index[str(ino)] = rel_path
+            index = read_index(p.stdout)
+        if p.returncode:
+            raise CalledProcessError(p.returncode, cmd)
         return index
 
-    def _create_link_dest_dir(
-        self,
-        src_index: dict[str, str],
-    ) -> tempfile.TemporaryDirectory[str]:
-        dest_index = {}
-        if os.path.isfile(self._dest_index_path):
-            with open(self._dest_index_path, "rb") as f:
-                dest_index = json.load(f)
+    def _mirror_remote(self, *, dry_run: bool) -> None:
+        src_index = self._scan()
+        cmd = self._serve_cmd(self.dest, "stage", self.dest.path)
+        with Popen(cmd, stdin=PIPE, stdout=PIPE) as p:
+            assert p.stdin is not None and p.stdout is not None
+            try:
+                with self.stats.time("stage remote"):
+                    write_index(p.stdin, src_index)
+                    line = p.stdout.readline()
+                if line:
+                    reply = json.loads(line)
+                    self.stats.renames = reply["renames"]
+                    self.stats.linked_bytes = reply["linked_bytes"]
+                    for phase, elapsed in reply["times"].items():
+                        self.stats.times[f"remote {phase}"] = elapsed
+                    self._run(
+                        dry_run=dry_run,
+                        link_dest=reply["link_dest"],
+                        src_index=src_index,
+                    )
+                    if not dry_run:
+                        p.stdin.write(b"commit\n")
+            finally:
+                p.stdin.close()
+        if p.returncode:
+            raise CalledProcessError(p.returncode, cmd)
 
-        tempdir = tempfile.TemporaryDirectory(
-            dir=os.path.dirname(self.dest.path),
-        )
-        for ino in set(dest_index.keys()) & set(src_index.keys()):
-            dest_path = dest_index[ino]
-            src_path = src_index[ino]
-            if dest_path != src_path:
-                src = os.path.join(self.dest.path, dest_path)
-                dst = os.path.join(tempdir.name, src_path)
-                os.makedirs(os.fsencode(os.path.dirname(dst)), exist_ok=True)
-                os.link(os.fsencode(src), os.fsencode(dst))
-        return tempdir
-
-    def _run(self, *, dry_run: bool, link_dest: str | None) -> None:
-        cmd = [
-            *self.args,
+    def _rsync_cmd(
+        self,
+        args: list[str],
+        *,
+        dry_run: bool,
+        link_dest: str | None,
+    ) -> list[str]:
+        return [
+            *args,
             *(["-n"] if dry_run else []),
             *(["--link-dest", link_dest] if link_dest is not None else []),
             "-v",
             self.src.serialize(),
             self.dest.serialize(),
         ]
+
+    def _split_shards(self, src_index: dict[int, str]) -> list[list[str]]:
+        """
+        Split the top-level entries of the source in at most jobs groups
+        of similar weight, the total size of their files plus a fixed cost
+        per file.
+        """
+        weights = dict.fromkeys(os.listdir(self.src.path), 0)
+        for rel_path in src_index.values():
+            try:
+                st = os.lstat(os.path.join(self.src.path, rel_path))
+            except OSError:
+                continue
+            name = rel_path.split(os.sep, 1)[0]
+            weights[name] = weights.get(name, 0) + st.st_size + FILE_WEIGHT
+        heap: list[tuple[int, int, list[str]]] = [
+            (0, i, []) for i in range(min(self.jobs, len(weights)))
+        ]
+        for name in sorted(weights, key=lambda name: -weights[name]):
+            weight, i, names = heapq.heappop(heap)
+            names.append(name)
+            heapq.heappush(heap, (weight + weights[name], i, names))
+        return [names for _, _, names in heap]
+
+    def _run_shards(
+        self,
+        shards: list[list[str]],
+        *,
+        dry_run: bool,
+        link_dest: str | None,
+    ) -> None:
+        """
+        Run an rsync process without --delete for each group of top-level
+        entries, filtering out the other entries, then a single pass that
+        only deletes extraneous files. The processes are run with --force,
+        so that a non-empty directory can still be replaced by a file.
+        """
+        args = [
+            *(
+                arg
+                for arg in self.args
+                if not arg.startswith("--delete") and arg != "--progress"
+            ),
+            "--force",
+        ]
+        processes = []
+        for names in shards:
+            filters = [
+                *(f"--include=/{_escape_pattern(name)}" for name in names),
+                "--exclude=/*",
+            ]
+            cmd = self._rsync_cmd(
+                [*args, *filters],
+                dry_run=dry_run,
+                link_dest=link_dest,
+            )
+            processes.append(Popen(cmd))
+        for p in processes:
+            if p.wait():
+                for other in processes:
+                    other.wait()
+                raise CalledProcessError(p.returncode, p.args)
+        cmd = self._rsync_cmd(
+            [*self.args, "--existing", "--ignore-existing"],
+            dry_run=dry_run,
+            link_dest=None,
+        )
         run(cmd, check=True)
 
-    def mirror(self, *, dry_run: bool) -> None:
-        if (
-            not self.src.host
-            and not self.dest.host
-            and os.path.isdir(self.src.path)
-        ):
-            src_index = self._create_index()
-            tempdir = self._create_link_dest_dir(src_index)
-            self._run(dry_run=dry_run, link_dest=os.path.abspath(tempdir.name))
+    def _run(
+        self,
+        *,
+        dry_run: bool,
+        link_dest: str | None,
+        src_index: dict[int, str] | None = None,
+    ) -> None:
+        with self.stats.time("rsync"):
+            if self.jobs > 1 and src_index is not None and not self.src.host:
+                shards = self._split_shards(src_index)
+                self._run_shards(shards, dry_run=dry_run, link_dest=link_dest)
+                return
+            cmd = self._rsync_cmd(
+                self.args,
+                dry_run=dry_run,
+                link_dest=link_dest,
+            )
+            run(cmd, check=True)
 
+    def mirror(self, *, dry_run: bool) -> None:
+        if self.src.host and self.dest.host:
+            self._run(dry_run=dry_run, link_dest=None)
+        elif self.dest.host:
+            if os.path.isdir(self.src.path):
+                self._mirror_remote(dry_run=dry_run)
+            else:
+                self._run(dry_run=dry_run, link_dest=None)
+        elif self.src.host or os.path.isdir(self.src.path):
+            src_index = self._scan()
+            with self.stats.time("load index"):
+                dest_index = load_dest_index(self.dest.path)
+            with self.stats.time("find renames"):
+                renames = self._find_renames(src_index, dest_index)
+            self.stats.renames = len(renames)
+            with self.stats.time("link"):
+                tempdir, self.stats.linked_bytes = create_link_dest_dir(
+                    self.dest.path,
+                    renames,
+                )
+            with tempdir as link_dest:
+                self._run(
+                    dry_run=dry_run,
+                    link_dest=os.path.abspath(link_dest),
+                    src_index=src_index,
+                )
             if not dry_run:
-                with open(self._dest_index_path, "w", encoding="utf-8") as f:
-                    json.dump(src_index, f, indent=4)
+                with self.stats.time("update index"):
+                    update_dest_index(self.dest.path, dest_index, src_index)
         else:
             self._run(dry_run=dry_run, link_dest=None)
 
 
+def _escape_pattern(name: str) -> str:
+    # rsync treats backslashes as escapes only in wildcard patterns
+    if not re.search(r"[*?[]", name):
+        return name
+    return re.sub(r"([*?[\\])", r"\\\1", name)
+
+
 def _parse_address(address: str) -> Address:
     address = os.fsdecode(urllib.parse.unquote_to_bytes(address))
     address_re = re.compile(r"(?:([^/:]*):)?(.*)")
@@ -144,15 +872,60 @@ def main() -> None:
     Synchronize two directories using rsync, with support for
     inode-based file rename detection.
     """
+    # imported here, as this module also runs on its own on remote hosts
+    from . import util
+
     parser = argparse.ArgumentParser(description=main.__doc__)
     parser.add_argument("-n", "--dry-run", action="store_true")
+    parser.add_argument(
+        "--match-content",
+        action="store_true",
+        help="also detect renamed files with a new inode by their content, "
+        "if the source and the destination are local",
+    )
+    parser.add_argument(
+        "--cache",
+        default=util.cache_path("mirror.sqlite3"),
+        help="cache file hashes in the database CACHE",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="split the top-level entries of the source between JOBS "
+        "concurrent rsync processes, followed by a deletion pass",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print the number of indexed and renamed files, the size of "
+        "the linked files and the time spent in each phase",
+    )
     parser.add_argument("src", type=_parse_address)
     parser.add_argument("dest", type=_parse_address)
     known_args, args = parser.parse_known_args()
+    if known_args.match_content and (
+        known_args.src.host or known_args.dest.host
+    ):
+        parser.error("--match-content requires a local source and destination")
 
-    rsync = Rsync(args, known_args.src, known_args.dest)
+    rsync = Rsync(
+        args,
+        known_args.src,
+        known_args.dest,
+        known_args.match_content,
+        known_args.cache,
+        jobs=known_args.jobs,
+    )
     rsync.mirror(dry_run=known_args.dry_run)
+    if known_args.stats:
+        for line in rsync.stats.format():
+            print(line)
 
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == [SERVE_ARG]:
+        serve(sys.argv[2:])
+    else:
+        main()
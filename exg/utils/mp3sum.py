@@ -1,9 +1,25 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import argparse
-import hashlib
+import contextlib
 import os
+import sys
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from ctypes import Structure, c_uint8
+from io import BufferedReader
+from itertools import chain
+from pathlib import Path
+from typing import TYPE_CHECKING, TypeVar
+
+from . import filehash, util
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Iterator
+
+T = TypeVar("T")
 
 
 class id3v2_header(Structure):
@@ -16,29 +32,190 @@ class id3v2_header(Structure):
     )
 
 
-def hash_mp3(path: str) -> str:
-    with open(path, "rb") as f:
-        data_size = os.fstat(f.fileno()).st_size
-
-        tag_size = 0
-        data = f.read(10)
-        if len(data) == 10 and data[:3] == b"ID3":
-            header = id3v2_header.from_buffer_copy(data)
-            for byte in header.size:
-                tag_size = (tag_size << 7) + byte
+def get_audio_range(f: BufferedReader) -> tuple[int, int]:
+    """
+    Return the offset and the size of the audio data of a MP3 file,
+    excluding ID3 tags.
+    """
+    file_size = os.fstat(f.fileno()).st_size
+    data_size = file_size
+
+    tag_size = 0
+    f.seek(0)
+    data = f.read(10)
+    if len(data) == 10 and data[:3] == b"ID3":
+        header = id3v2_header.from_buffer_copy(data)
+        for byte in header.size:
+            tag_size = (tag_size << 7) + byte
+        tag_size += 10
+        if header.flags & (1 << 4):
             tag_size += 10
-            if header.flags & (1 << 4):
-                tag_size += 10
-            data_size -= tag_size
+        data_size -= tag_size
 
+    if file_size >= 128:
         f.seek(-128, 2)
         if f.read(3) == b"TAG":
             data_size -= 128
 
-        f.seek(tag_size)
-        h = hashlib.sha256()
-        h.update(f.read(data_size))
-        return h.hexdigest()
+    return tag_size, data_size
+
+
+def hash_mp3(path: str) -> str:
+    with open(path, "rb") as f:
+        return filehash.hash_range(f, *get_audio_range(f))
+
+
+def audio_size(path: str) -> int:
+    with open(path, "rb") as f:
+        return get_audio_range(f)[1]
+
+
+def hash_sample(path: str) -> str:
+    """
+    Compute the SHA256 hash of the head and of the tail of the audio data
+    of a MP3 file.
+    """
+    with open(path, "rb") as f:
+        return filehash.hash_sample(f, *get_audio_range(f))
+
+
+def find_files(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for p in sorted(Path(path).rglob("*")):
+                if p.suffix.lower() == ".mp3" and p.is_file():
+                    yield str(p)
+        else:
+            yield path
+
+
+def hash_files(
+    paths: Iterable[str],
+    jobs: int | None = None,
+    cache: filehash.HashCache | None = None,
+    on_error: Callable[[str, OSError], None] | None = None,
+) -> Iterator[tuple[str, str]]:
+    """
+    Yield the path and the hash of each file, in order.
+
+    If on_error is given, it is called with the path and the exception of
+    each file that cannot be hashed, and the file is skipped; otherwise
+    the exception is raised.
+    """
+    window = 2 * (jobs or os.cpu_count() or 1)
+    pending: deque[
+        tuple[str, os.stat_result | None, str | Future[str] | OSError]
+    ] = deque()
+
+    def complete() -> tuple[str, str] | None:
+        path, st, result = pending.popleft()
+        try:
+            if isinstance(result, OSError):
+                raise result
+            if isinstance(result, Future):
+                digest = result.result()
+                if cache and st:
+                    cache.put(path, st, None, digest)
+            else:
+                digest = result
+        except OSError as e:
+            if on_error is None:
+                raise
+            on_error(path, e)
+            return None
+        return path, digest
+
+    # hashlib releases the GIL while hashing large buffers
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for path in paths:
+            try:
+                # stat before hashing, so that a concurrent modification
+                # invalidates the cache entry
+                st = os.stat(path)
+            except OSError as e:
+                pending.append((path, None, e))
+            else:
+                digest = cache.get(st)[1] if cache else None
+                if digest is None:
+                    pending.append((path, st, executor.submit(hash_mp3, path)))
+                else:
+                    pending.append((path, st, digest))
+            while len(pending) > window or (
+                pending and not isinstance(pending[0][2], Future)
+            ):
+                if (item := complete()) is not None:
+                    yield item
+        while pending:
+            if (item := complete()) is not None:
+                yield item
+
+
+def _refine(
+    groups: list[list[str]],
+    keys: Iterator[int | str | OSError],
+    on_error: Callable[[str, OSError], None] | None = None,
+) -> list[list[str]]:
+    # keys yields the key of each path of each group, in order
+    refined: list[list[str]] = []
+    for group in groups:
+        subgroups: dict[int | str, list[str]] = defaultdict(list)
+        for path in group:
+            key = next(keys)
+            if isinstance(key, OSError):
+                if on_error is None:
+                    raise key
+                on_error(path, key)
+                continue
+            subgroups[key].append(path)
+        refined.extend(g for g in subgroups.values() if len(g) > 1)
+    return refined
+
+
+def _catch(fn: Callable[[str], T]) -> Callable[[str], T | OSError]:
+    def wrapper(path: str) -> T | OSError:
+        try:
+            return fn(path)
+        except OSError as e:
+            return e
+
+    return wrapper
+
+
+def find_duplicates(
+    paths: Iterable[str],
+    jobs: int | None = None,
+    cache: filehash.HashCache | None = None,
+    on_error: Callable[[str, OSError], None] | None = None,
+) -> list[list[str]]:
+    """
+    Find the MP3 files with the same audio data, excluding ID3 tags. A
+    file reached through several paths, including hard links, is listed
+    once.
+    """
+    files: dict[tuple[int, int] | str, str] = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            # reported when its size is read
+            files.setdefault(path, path)
+        else:
+            files.setdefault((st.st_dev, st.st_ino), path)
+    groups = [list(files.values())]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        sizes = executor.map(_catch(audio_size), chain(*groups))
+        groups = _refine(groups, sizes, on_error)
+        samples = executor.map(_catch(hash_sample), chain(*groups))
+        groups = _refine(groups, samples, on_error)
+    # the files that fail now are reported and dropped from their group
+    digests: dict[str, str] = dict(
+        hash_files(chain(*groups), jobs, cache, on_error)
+    )
+    refined = []
+    for group in groups:
+        group = [path for path in group if path in digests]
+        refined.extend(_refine([group], (digests[p] for p in group)))
+    return refined
 
 
 def main() -> None:
@@ -46,10 +223,66 @@ def main() -> None:
     Compute the SHA256 hash of a MP3 file excluding ID3 tags, if any.
     """
     parser = argparse.ArgumentParser(description=main.__doc__)
-    parser.add_argument("file")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="hash up to JOBS files in parallel",
+    )
+    parser.add_argument(
+        "-d",
+        "--duplicates",
+        action="store_true",
+        help="list the groups of files with the same audio data",
+    )
+    parser.add_argument(
+        "--cache",
+        default=util.cache_path("mp3sum.sqlite3"),
+        help="cache hashes in the database CACHE",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="do not use the hash cache",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="remove the cache entries of deleted or modified files",
+    )
+    parser.add_argument("files", metavar="file", nargs="*")
     args = parser.parse_args()
+    if not args.files and not args.prune:
+        parser.error("at least one file is required")
+
+    failed = False
+
+    def report(path: str, error: OSError) -> None:
+        nonlocal failed
+        failed = True
+        message = error.strerror or error
+        print(f"{parser.prog}: {path}: {message}", file=sys.stderr)
 
-    print(hash_mp3(args.file))
+    with contextlib.ExitStack() as stack:
+        cache = None
+        if not args.no_cache:
+            cache = stack.enter_context(filehash.HashCache(args.cache))
+        files = find_files(args.files)
+        if args.duplicates:
+            groups = find_duplicates(files, args.jobs, cache, report)
+            for i, group in enumerate(groups):
+                if i:
+                    print()
+                for path in group:
+                    print(path)
+        else:
+            for path, digest in hash_files(files, args.jobs, cache, report):
+                print(f"{digest}  {path}")
+        if cache and args.prune:
+            cache.prune()
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,23 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import argparse
-import tarfile
+import sys
+from typing import TYPE_CHECKING
+
+from . import tarindex
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping
+
+
+def print_member(
+    name: str, mode: int, size: int, pax_headers: Mapping[str, str]
+) -> None:
+    print(f"{name} {mode:o} {size}")
+    for key, value in pax_headers.items():
+        print("  ", key, value)
 
 
 def main() -> None:
@@ -9,14 +25,41 @@ def main() -> None:
     List the content of a TAR archive.
     """
     parser = argparse.ArgumentParser(description=main.__doc__)
-    parser.add_argument("file")
+    parser.add_argument(
+        "-i",
+        "--index",
+        action="store_true",
+        help="use the sidecar index FILE.idx, building it if needed",
+    )
+    parser.add_argument(
+        "-x",
+        "--extract",
+        metavar="MEMBER",
+        help="write the content of MEMBER to the standard output",
+    )
+    parser.add_argument("file", help='archive, or "-" for the standard input')
     args = parser.parse_args()
+    if (args.index or args.extract) and args.file == "-":
+        parser.error("the index cannot be used with the standard input")
 
-    with tarfile.open(args.file) as tf:
-        for member in tf.getmembers():
-            print(f"{member.name} {member.mode:o} {member.size}")
-            for name, value in member.pax_headers.items():
-                print("  ", name, value)
+    if args.index or args.extract:
+        if args.index:
+            index = tarindex.get_index(args.file)
+        else:
+            # without -i, the index is kept in memory only
+            index = tarindex.build_index(args.file)
+        if args.extract:
+            for entry in index.entries:
+                if entry.name == args.extract:
+                    for data in index.read_member(args.file, entry):
+                        sys.stdout.buffer.write(data)
+                    return
+            sys.exit(f"{args.extract}: not found in archive")
+        entries: Iterable[tarindex.Entry] = index.entries
+    else:
+        entries = tarindex.iter_entries(args.file)
+    for entry in entries:
+        print_member(entry.name, entry.mode, entry.size, entry.pax_headers)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,42 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import argparse
-import tarfile
+from collections import defaultdict
+from typing import TYPE_CHECKING
+
+from . import tarindex, util
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
 
-from . import util
+
+def get_size(members: Iterable[tuple[str, int, bool]], prefix: str) -> int:
+    return sum(size for name, size, _ in members if name.startswith(prefix))
+
+
+def get_dir_sizes(
+    members: Iterable[tuple[str, int, bool]],
+    prefix: str,
+    depth: int,
+) -> dict[str, int]:
+    """
+    Compute the total size of each directory up to depth levels deep, like
+    du --max-depth.
+    """
+    sizes: dict[str, int] = defaultdict(int)
+    for name, size, is_dir in members:
+        if not name.startswith(prefix):
+            continue
+        # names such as "./a/b", written by "tar -cf - .", are relative to
+        # the root too
+        parts = [part for part in name.split("/") if part not in ("", ".")]
+        if not is_dir and parts:
+            parts.pop()
+        for i in range(min(depth, len(parts)) + 1):
+            sizes["/".join(parts[:i]) or "."] += size
+    return sizes
 
 
 def main() -> None:
@@ -12,15 +45,44 @@ def main() -> None:
     """
     parser = argparse.ArgumentParser(description=main.__doc__)
     parser.add_argument("--prefix", default="")
-    parser.add_argument("file")
+    parser.add_argument(
+        "-d",
+        "--depth",
+        type=int,
+        help="show the size of each directory up to DEPTH levels deep",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="decompress multi-member gzip or multi-frame zstd archives "
+        "with JOBS threads",
+    )
+    parser.add_argument(
+        "-i",
+        "--index",
+        action="store_true",
+        help="use the sidecar index FILE.idx, building it if needed",
+    )
+    parser.add_argument("file", help='archive, or "-" for the standard input')
     args = parser.parse_args()
+    if args.index and args.file == "-":
+        parser.error("the index cannot be used with the standard input")
+
+    entries: Iterable[tarindex.Entry]
+    if args.index:
+        entries = tarindex.get_index(args.file).entries
+    else:
+        entries = tarindex.iter_entries(args.file, args.jobs)
+    members = ((entry.name, entry.size, entry.isdir()) for entry in entries)
 
-    with tarfile.open(args.file) as tf:
-        size = 0
-        for member in tf.getmembers():
-            if member.name.startswith(args.prefix):
-                size += member.size
-        print(util.format_size(size))
+    if args.depth is None:
+        print(util.format_size(get_size(members, args.prefix)))
+        return
+    sizes = get_dir_sizes(members, args.prefix, args.depth)
+    for name in sorted(sizes):
+        print(f"{util.format_size(sizes[name])}\t{name}")
 
 
 if __name__ == "__main__":
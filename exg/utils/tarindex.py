@@ -0,0 +1,843 @@
+from __future__ import annotations
+
+import bisect
+import bz2
+import contextlib
+import io
+import itertools
+import json
+import lzma
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import astuple, dataclass, field
+from typing import IO, TYPE_CHECKING, BinaryIO, Callable, Protocol, TypeVar
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Iterator
+
+    from _typeshed import WriteableBuffer
+
+CHUNK_SIZE = 1 << 16
+# minimum distance in uncompressed bytes between two checkpoints
+CHECKPOINT_SPACING = 1 << 22
+INDEX_VERSION = 1
+
+
+def iter_members(path: str) -> Iterator[tarfile.TarInfo]:
+    """
+    Iterate over the members of an archive, or of the standard input if
+    path is "-", as their headers are read.
+    """
+    if path == "-":
+        tf = tarfile.open(fileobj=sys.stdin.buffer, mode="r|*")
+    else:
+        tf = tarfile.open(path)
+    with tf:
+        yield from _iter_tarfile(tf)
+
+
+def _iter_tarfile(tf: tarfile.TarFile) -> Iterator[tarfile.TarInfo]:
+    while (member := tf.next()) is not None:
+        # TarFile otherwise keeps every member read so far
+        tf.members.clear()  # type: ignore[attr-defined]
+        yield member
+
+
+class Decompressor(Protocol):
+    @property
+    def eof(self) -> bool: ...
+
+    @property
+    def unused_data(self) -> bytes: ...
+
+    def decompress(self, data: bytes, max_length: int, /) -> bytes: ...
+
+
+COMPRESSIONS: dict[str, tuple[bytes, Callable[[], Decompressor]]] = {
+    "gz": (b"\x1f\x8b", lambda: zlib.decompressobj(31)),
+    "bz2": (b"BZh", bz2.BZ2Decompressor),
+    "xz": (b"\xfd7zXZ\x00", lzma.LZMADecompressor),
+}
+
+
+def detect_compression(f: BinaryIO) -> str | None:
+    f.seek(0)
+    data = f.read(6)
+    f.seek(0)
+    for name, (magic, _) in COMPRESSIONS.items():
+        if data.startswith(magic):
+            return name
+    return None
+
+
+class DecompressReader(io.RawIOBase):
+    """
+    Decompress a sequence of independently compressed members (gzip
+    members, bz2 or xz streams), reporting the compressed and uncompressed
+    offsets at which each member starts.
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        compression: str,
+        on_member: Callable[[int, int], None] | None = None,
+    ) -> None:
+        self._fileobj = fileobj
+        self._magic, self._factory = COMPRESSIONS[compression]
+        self._decompressor: Decompressor | None = None
+        self._on_member = on_member
+        self._input = b""
+        self._input_offset = fileobj.tell()
+        self._buffer = b""
+        self._buffer_pos = 0
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill_input(self, size: int) -> None:
+        while len(self._input) < size:
+            data = self._fileobj.read(CHUNK_SIZE)
+            if not data:
+                return
+            self._input += data
+
+    def _decompress(self) -> bool:
+        if self._decompressor is None or self._decompressor.eof:
+            self._fill_input(len(self._magic))
+            if not self._input.startswith(self._magic):
+                return False
+            if self._on_member:
+                self._on_member(self.position, self._input_offset)
+            self._decompressor = self._factory()
+        decompressor = self._decompressor
+        # bz2 and lzma keep the input they have not consumed yet, zlib
+        # returns it in unconsumed_tail
+        needs_input = getattr(decompressor, "needs_input", True)
+        if needs_input:
+            self._fill_input(1)
+        data = self._input
+        self._buffer = decompressor.decompress(data, OUTPUT_CHUNK_SIZE)
+        self._buffer_pos = 0
+        if decompressor.eof:
+            self._input = decompressor.unused_data
+        else:
+            self._input = getattr(decompressor, "unconsumed_tail", b"")
+        self._input_offset += len(data) - len(self._input)
+        return bool(data or self._buffer or decompressor.eof or not needs_input)
+
+    def readinto(self, b: WriteableBuffer) -> int:
+        view = memoryview(b).cast("B")
+        while self._buffer_pos == len(self._buffer):
+            if not self._decompress():
+                return 0
+        n = min(len(view), len(self._buffer) - self._buffer_pos)
+        view[:n] = self._buffer[self._buffer_pos : self._buffer_pos + n]
+        self._buffer_pos += n
+        self.position += n
+        return n
+
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# approximate compressed size of the ranges decompressed by each task
+RANGE_SIZE = 1 << 22
+# maximum decompressed size of a range held in memory
+RANGE_OUTPUT_LIMIT = 1 << 25
+# maximum size of the chunks of decompressed data of a range
+OUTPUT_CHUNK_SIZE = 1 << 20
+
+
+def _find_gzip_member(f: BinaryIO, offset: int) -> int | None:
+    """
+    Return the offset of the first plausible gzip member at or after
+    offset, that is a gzip header followed by data that inflates without
+    errors. The candidates are confirmed by decompressing whole ranges.
+    """
+    while True:
+        f.seek(offset)
+        data = f.read(RANGE_SIZE)
+        pos = 0
+        while (pos := data.find(b"\x1f\x8b\x08", pos)) >= 0:
+            # the reserved flag bits must be zero
+            if pos + 3 < len(data) and not data[pos + 3] & 0xE0:
+                f.seek(offset + pos)
+                try:
+                    zlib.decompressobj(31).decompress(
+                        f.read(CHUNK_SIZE), OUTPUT_CHUNK_SIZE
+                    )
+                except zlib.error:
+                    pass
+                else:
+                    return offset + pos
+            pos += 1
+        if len(data) < RANGE_SIZE:
+            return None
+        offset += len(data) - 3
+
+
+def _split_gzip(f: BinaryIO, size: int) -> list[int]:
+    starts = [0]
+    offset = RANGE_SIZE
+    while offset < size:
+        start = _find_gzip_member(f, offset)
+        if start is None:
+            break
+        starts.append(start)
+        offset = max(start + 1, offset + RANGE_SIZE)
+    return starts
+
+
+def _zstd_frame_size(f: BinaryIO, start: int) -> int:
+    f.seek(start)
+    header = f.read(8)
+    magic = int.from_bytes(header[:4], "little")
+    if 0x184D2A50 <= magic <= 0x184D2A5F and len(header) == 8:
+        # skippable frame
+        return 8 + int.from_bytes(header[4:], "little")
+    if not header.startswith(ZSTD_MAGIC) or len(header) < 5:
+        raise ValueError("invalid zstd frame")
+    descriptor = header[4]
+    single_segment = descriptor >> 5 & 1
+    pos = (
+        5
+        + (not single_segment)
+        + (0, 1, 2, 4)[descriptor & 3]
+        + (single_segment, 2, 4, 8)[descriptor >> 6]
+    )
+    while True:
+        f.seek(start + pos)
+        data = f.read(3)
+        if len(data) < 3:
+            raise ValueError("truncated zstd frame")
+        block = int.from_bytes(data, "little")
+        block_type = block >> 1 & 3
+        if block_type == 3:
+            raise ValueError("invalid zstd block")
+        # an RLE block stores a single byte
+        pos += 3 + (1 if block_type == 1 else block >> 3)
+        if block & 1:
+            break
+    if descriptor & 4:
+        pos += 4
+    return pos
+
+
+def _split_zstd(f: BinaryIO, size: int) -> list[int]:
+    starts = [0]
+    offset = 0
+    while offset < size:
+        if offset - starts[-1] >= RANGE_SIZE:
+            starts.append(offset)
+        offset += _zstd_frame_size(f, offset)
+    return starts
+
+
+SPLITTERS: dict[str, Callable[[BinaryIO, int], list[int]]] = {
+    "gz": _split_gzip,
+    "zst": _split_zstd,
+}
+
+
+def _inflate(f: BinaryIO, size: int) -> Iterator[bytes]:
+    """
+    Decompress the whole gzip members in the next size bytes of a file, in
+    chunks of at most OUTPUT_CHUNK_SIZE bytes. Raise ValueError if they are
+    not whole members.
+    """
+    decompressor = zlib.decompressobj(31)
+    data = b""
+    while True:
+        if not data and size > 0:
+            data = f.read(min(CHUNK_SIZE, size))
+            # the range ends early if the file is truncated
+            size = size - len(data) if data else 0
+        try:
+            chunk = decompressor.decompress(data, OUTPUT_CHUNK_SIZE)
+        except zlib.error:
+            raise ValueError("invalid gzip data") from None
+        if chunk:
+            yield chunk
+        if decompressor.eof:
+            data = decompressor.unused_data
+            if not data and not size:
+                return
+            decompressor = zlib.decompressobj(31)
+        else:
+            data = decompressor.unconsumed_tail
+            if not data and not size and not chunk:
+                raise ValueError("truncated gzip data")
+
+
+def _unzstd(
+    f: BinaryIO, size: int | None = None
+) -> Generator[bytes, None, None]:
+    """
+    Decompress the zstd frames in the next size bytes of a file, or up to
+    its end, with the zstd command.
+    """
+
+    def feed(stdin: IO[bytes]) -> None:
+        remaining = size
+        try:
+            with stdin:
+                while remaining is None or remaining > 0:
+                    n = CHUNK_SIZE if remaining is None else remaining
+                    data = f.read(min(n, CHUNK_SIZE))
+                    if not data:
+                        break
+                    stdin.write(data)
+                    if remaining is not None:
+                        remaining -= len(data)
+        except BrokenPipeError:
+            pass
+
+    with subprocess.Popen(
+        ["zstd", "-dcq"], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    ) as proc:
+        stdin, stdout = proc.stdin, proc.stdout
+        assert stdin is not None and stdout is not None
+        feeder = threading.Thread(target=feed, args=(stdin,))
+        feeder.start()
+        try:
+            yield from iter(lambda: stdout.read(CHUNK_SIZE), b"")
+        except BaseException:
+            # do not wait for a process blocked on a full pipe
+            proc.kill()
+            raise
+        finally:
+            feeder.join()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+
+def _iter_range(
+    path: str, compression: str, start: int, end: int
+) -> Generator[bytes, None, None]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        if compression == "zst":
+            yield from _unzstd(f, end - start)
+            return
+        try:
+            yield from _inflate(f, end - start)
+        except ValueError as e:
+            raise ValueError(f"{path}: {e} at offset {start}") from None
+
+
+def _decompress_range(
+    path: str, compression: str, start: int, end: int
+) -> bytes | None:
+    """
+    Decompress a range of whole members or frames, or return None if it
+    does not consist of whole members or if it decompresses to more than
+    RANGE_OUTPUT_LIMIT bytes.
+    """
+    output = []
+    total = 0
+    chunks = _iter_range(path, compression, start, end)
+    try:
+        for chunk in chunks:
+            total += len(chunk)
+            if total > RANGE_OUTPUT_LIMIT:
+                return None
+            output.append(chunk)
+    except ValueError:
+        return None
+    finally:
+        chunks.close()
+    return b"".join(output)
+
+
+def _stream(path: str, compression: str) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        if compression == "zst":
+            yield from _unzstd(f)
+            return
+        reader = DecompressReader(f, compression)
+        yield from iter(lambda: reader.read(CHUNK_SIZE), b"")
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def _map_ordered(
+    executor: Executor,
+    fn: Callable[[T], R],
+    items: list[T],
+    window: int,
+) -> Iterator[R]:
+    """
+    Like executor.map, but submit at most window items ahead of the
+    result being consumed.
+    """
+    pending: deque[Future[R]] = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) == window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def iter_decompressed(
+    path: str, compression: str, jobs: int = 1
+) -> Generator[bytes, None, None]:
+    """
+    Decompress an archive in chunks, in order. Multi-member gzip and
+    multi-frame zstd files are split in ranges of whole members or frames,
+    which are decompressed by jobs threads, holding at most 2 * jobs
+    ranges of up to RANGE_OUTPUT_LIMIT decompressed bytes in memory.
+    Ranges that decompress to more than that are streamed instead.
+    """
+    starts = [0]
+    if jobs > 1 and compression in SPLITTERS:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            starts = SPLITTERS[compression](f, size)
+    if len(starts) < 2:
+        yield from _stream(path, compression)
+        return
+
+    ranges = list(zip(starts, [*starts[1:], size]))
+    with ThreadPoolExecutor(jobs) as executor:
+        results = _map_ordered(
+            executor,
+            lambda r: _decompress_range(path, compression, *r),
+            ranges,
+            2 * jobs,
+        )
+        failed_start = None
+        for (start, _), data in zip(ranges, results):
+            if data is None:
+                # a false member boundary, at the start or at the end, or
+                # too much data to hold in memory
+                if failed_start is None:
+                    failed_start = start
+                continue
+            if failed_start is not None:
+                yield from _iter_range(path, compression, failed_start, start)
+                failed_start = None
+            yield data
+        if failed_start is not None:
+            yield from _iter_range(path, compression, failed_start, size)
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    Read the concatenation of an iterator of bytes objects.
+    """
+
+    def __init__(self, chunks: Generator[bytes, None, None]) -> None:
+        self._chunks = chunks
+        self._buffer = b""
+        self._buffer_pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        # stop the decompression, which may run in another process
+        self._chunks.close()
+        super().close()
+
+    def readinto(self, b: WriteableBuffer) -> int:
+        view = memoryview(b).cast("B")
+        while self._buffer_pos == len(self._buffer):
+            self._buffer = next(self._chunks, b"")
+            self._buffer_pos = 0
+            if not self._buffer:
+                return 0
+        n = min(len(view), len(self._buffer) - self._buffer_pos)
+        view[:n] = self._buffer[self._buffer_pos : self._buffer_pos + n]
+        self._buffer_pos += n
+        return n
+
+
+@dataclass
+class Entry:
+    name: str
+    offset: int
+    offset_data: int
+    size: int
+    mode: int
+    type: str
+    pax_headers: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_tarinfo(cls, member: tarfile.TarInfo) -> Entry:
+        return cls(
+            member.name,
+            member.offset,
+            member.offset_data,
+            member.size,
+            member.mode,
+            member.type.decode("latin-1"),
+            dict(member.pax_headers),
+        )
+
+    def isdir(self) -> bool:
+        return self.type == "5"
+
+
+class UnsupportedHeader(ValueError):
+    pass
+
+
+BLOCK_SIZE = 512
+# types whose data blocks follow the header, besides the unknown ones
+_DATA_TYPES = ("0", "\0", "7")
+_KNOWN_TYPES = (*_DATA_TYPES, "1", "2", "3", "4", "5", "6", "L", "K", "x")
+
+
+def _nts(data: bytes) -> str:
+    end = data.find(b"\0")
+    if end >= 0:
+        data = data[:end]
+    return data.decode("utf-8", "surrogateescape")
+
+
+def _nti(data: bytes) -> int:
+    if data[0] in (0o200, 0o377):
+        n = int.from_bytes(data[1:], "big")
+        if data[0] == 0o377:
+            n -= 256 ** (len(data) - 1)
+        return n
+    end = data.find(b"\0")
+    if end >= 0:
+        data = data[:end]
+    try:
+        return int(data.strip() or b"0", 8)
+    except ValueError:
+        raise UnsupportedHeader("invalid number field") from None
+
+
+def _parse_pax(data: bytes) -> dict[str, str]:
+    headers = {}
+    pos = 0
+    while pos < len(data) and data[pos] != 0:
+        space = data.find(b" ", pos)
+        length = int(data[pos:space]) if data[pos:space].isdigit() else 0
+        if length <= 0:
+            raise UnsupportedHeader("invalid pax header")
+        record = data[space + 1 : pos + length - 1]
+        key, _, value = record.partition(b"=")
+        headers[key.decode("utf-8")] = value.decode(
+            "utf-8",
+            "surrogateescape",
+        )
+        pos += length
+    if "hdrcharset" in headers or any(
+        key.startswith("GNU.sparse.") for key in headers
+    ):
+        raise UnsupportedHeader("unsupported pax header")
+    return headers
+
+
+def _blocks(size: int) -> int:
+    return -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+
+def scan_entries(f: BinaryIO, seekable: bool = True) -> Iterator[Entry]:
+    """
+    Read the ustar, GNU and pax headers of an uncompressed archive
+    directly, seeking past the data blocks if the stream is seekable.
+    Raise UnsupportedHeader on anything unusual, such as sparse members
+    or global pax headers, for which tarfile should be used instead.
+    """
+    offset = 0
+    if seekable:
+        end = f.seek(0, io.SEEK_END)
+        f.seek(0)
+
+    def skip(size: int) -> None:
+        if seekable:
+            if f.seek(size, io.SEEK_CUR) > end:
+                raise UnsupportedHeader("truncated archive")
+            return
+        while size > 0:
+            data = f.read(min(size, CHUNK_SIZE))
+            if not data:
+                raise UnsupportedHeader("truncated archive")
+            size -= len(data)
+
+    def read_data(size: int) -> bytes:
+        data = f.read(_blocks(size))
+        if len(data) < _blocks(size):
+            raise UnsupportedHeader("truncated archive")
+        return data[:size]
+
+    long_name = None
+    pax_headers: dict[str, str] = {}
+    start = offset
+    while True:
+        block = f.read(BLOCK_SIZE)
+        if len(block) < BLOCK_SIZE or block.count(0) == BLOCK_SIZE:
+            return
+        checksum = _nti(block[148:156])
+        # the checksum field counts as spaces
+        if checksum != 256 + sum(block) - sum(block[148:156]):
+            raise UnsupportedHeader("bad checksum")
+        name = _nts(block[0:100])
+        size = _nti(block[124:136])
+        member_type = chr(block[156])
+        offset += BLOCK_SIZE
+        if member_type not in _KNOWN_TYPES:
+            raise UnsupportedHeader(f"unsupported type {member_type!r}")
+        if member_type in ("L", "K", "x"):
+            data = read_data(size)
+            offset += _blocks(size)
+            if member_type == "L":
+                long_name = _nts(data)
+            elif member_type == "x":
+                pax_headers.update(_parse_pax(data))
+            continue
+        if member_type == "0" and name.endswith("/"):
+            member_type = "5"
+        prefix = _nts(block[345:500])
+        if member_type == "5":
+            name = name.rstrip("/")
+        if prefix:
+            name = prefix + "/" + name
+        if long_name is not None:
+            name = long_name
+            if member_type == "5":
+                name = name.removesuffix("/")
+        if "path" in pax_headers:
+            name = pax_headers["path"].rstrip("/")
+        if "size" in pax_headers:
+            size = int(pax_headers["size"])
+
+        yield Entry(
+            name,
+            start,
+            offset,
+            size,
+            _nti(block[100:108]),
+            member_type,
+            pax_headers,
+        )
+        if member_type in _DATA_TYPES:
+            skip(_blocks(size))
+            offset += _blocks(size)
+        long_name = None
+        pax_headers = {}
+        start = offset
+
+
+def _detect(path: str) -> str | None:
+    with open(path, "rb") as f:
+        compression = detect_compression(f)
+        if compression is None and f.read(4) == ZSTD_MAGIC:
+            compression = "zst"
+    return compression
+
+
+def iter_entries(path: str, jobs: int = 1) -> Iterator[Entry]:
+    """
+    Iterate over the members of an archive, or of the standard input if
+    path is "-". Archives are read with scan_entries, falling back to
+    tarfile where it gives up. Compressed archives are decompressed by
+    iter_decompressed.
+    """
+    if path == "-":
+        for member in iter_members(path):
+            yield Entry.from_tarinfo(member)
+        return
+
+    count = 0
+    compression = _detect(path)
+    try:
+        if compression is None:
+            with open(path, "rb") as f:
+                for entry in scan_entries(f):
+                    yield entry
+                    count += 1
+        else:
+            chunks = iter_decompressed(path, compression, jobs)
+            with io.BufferedReader(ChunkReader(chunks)) as stream:
+                for entry in scan_entries(stream, seekable=False):
+                    yield entry
+                    count += 1
+        return
+    except UnsupportedHeader:
+        pass
+
+    with contextlib.ExitStack() as stack:
+        if compression is None:
+            tf = tarfile.open(path)
+        else:
+            chunks = iter_decompressed(path, compression, jobs)
+            stream = io.BufferedReader(ChunkReader(chunks))
+            stack.enter_context(stream)
+            tf = tarfile.open(fileobj=stream, mode="r|")
+        with tf:
+            for member in itertools.islice(_iter_tarfile(tf), count, None):
+                yield Entry.from_tarinfo(member)
+
+
+@dataclass
+class TarIndex:
+    size: int
+    mtime_ns: int
+    compression: str | None
+    # (uncompressed offset, compressed offset) of the restart points
+    checkpoints: list[tuple[int, int]]
+    entries: list[Entry]
+
+    def save(self, path: str) -> None:
+        header = {
+            "version": INDEX_VERSION,
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+            "compression": self.compression,
+            "checkpoints": self.checkpoints,
+        }
+        with tempfile.NamedTemporaryFile(
+            "w",
+            encoding="utf-8",
+            dir=os.path.dirname(os.path.abspath(path)),
+            delete=False,
+        ) as f:
+            try:
+                f.write(json.dumps(header) + "\n")
+                for entry in self.entries:
+                    f.write(json.dumps(astuple(entry)) + "\n")
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        try:
+            os.replace(f.name, path)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> TarIndex:
+        with open(path, encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != INDEX_VERSION:
+                raise ValueError(f"{path}: unsupported index version")
+            entries = [Entry(*json.loads(line)) for line in f]
+        return cls(
+            header["size"],
+            header["mtime_ns"],
+            header["compression"],
+            [(u, c) for u, c in header["checkpoints"]],
+            entries,
+        )
+
+    def is_valid(self, archive: str) -> bool:
+        st = os.stat(archive)
+        return (st.st_size, st.st_mtime_ns) == (self.size, self.mtime_ns)
+
+    def _open(self, f: BinaryIO, offset: int) -> BinaryIO:
+        """
+        Return a stream of the uncompressed archive positioned at offset,
+        starting from the nearest checkpoint. Archives compressed with zstd
+        have no checkpoints and are decompressed from the start.
+        """
+        if self.compression is None:
+            f.seek(offset)
+            return f
+        i = bisect.bisect_right(self.checkpoints, (offset, float("inf"))) - 1
+        position, compressed_offset = self.checkpoints[i] if i >= 0 else (0, 0)
+        f.seek(compressed_offset)
+        raw: io.RawIOBase
+        if self.compression == "zst":
+            raw = ChunkReader(_unzstd(f))
+        else:
+            raw = DecompressReader(f, self.compression)
+        stream = io.BufferedReader(raw)
+        remaining = offset - position
+        while remaining > 0:
+            data = stream.read(min(remaining, CHUNK_SIZE))
+            if not data:
+                raise EOFError
+            remaining -= len(data)
+        return stream
+
+    def read_member(self, archive: str, entry: Entry) -> Iterator[bytes]:
+        with open(archive, "rb") as f:
+            stream = self._open(f, entry.offset_data)
+            with stream:
+                remaining = entry.size
+                while remaining > 0:
+                    data = stream.read(min(remaining, CHUNK_SIZE))
+                    if not data:
+                        raise EOFError
+                    remaining -= len(data)
+                    yield data
+
+
+def _read_entries(
+    archive: str,
+    compression: str,
+    on_member: Callable[[int, int], None],
+    use_tarfile: bool,
+) -> list[Entry]:
+    with open(archive, "rb") as f:
+        reader = DecompressReader(f, compression, on_member)
+        stream = io.BufferedReader(reader)
+        if not use_tarfile:
+            return list(scan_entries(stream, seekable=False))
+        with tarfile.open(fileobj=stream, mode="r|") as tf:
+            return [Entry.from_tarinfo(member) for member in tf]
+
+
+def build_index(archive: str) -> TarIndex:
+    st = os.stat(archive)
+    checkpoints: list[tuple[int, int]] = []
+
+    def on_member(position: int, compressed_offset: int) -> None:
+        if not checkpoints or (
+            position - checkpoints[-1][0] >= CHECKPOINT_SPACING
+        ):
+            checkpoints.append((position, compressed_offset))
+
+    compression = _detect(archive)
+    if compression not in COMPRESSIONS:
+        entries = list(iter_entries(archive))
+    else:
+        try:
+            entries = _read_entries(archive, compression, on_member, False)
+        except UnsupportedHeader:
+            checkpoints.clear()
+            entries = _read_entries(archive, compression, on_member, True)
+    return TarIndex(
+        st.st_size,
+        st.st_mtime_ns,
+        compression,
+        checkpoints,
+        entries,
+    )
+
+
+def get_index(archive: str) -> TarIndex:
+    """
+    Load the sidecar index of an archive, building it if it is missing or
+    out of date. If the index cannot be saved, for example because the
+    directory of the archive is read-only, it is kept in memory only.
+    """
+    path = archive + ".idx"
+    try:
+        index = TarIndex.load(path)
+    except (OSError, ValueError):
+        pass
+    else:
+        if index.is_valid(archive):
+            return index
+    index = build_index(archive)
+    try:
+        index.save(path)
+    except OSError as e:
+        print(f"{path}: cannot save index: {e.strerror}", file=sys.stderr)
+    return index
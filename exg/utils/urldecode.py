@@ -5,9 +5,30 @@ import sys
 from typing import BinaryIO
 from urllib.parse import unquote_to_bytes
 
+CHUNK_SIZE = 1 << 20
 
-def decode(input_stream: BinaryIO, output_stream: BinaryIO) -> None:
-    output_stream.write(unquote_to_bytes(input_stream.read()))
+
+def decode(
+    input_stream: BinaryIO,
+    output_stream: BinaryIO,
+    chunk_size: int = CHUNK_SIZE,
+) -> None:
+    pending = b""
+    while chunk := input_stream.read(chunk_size):
+        data = pending + chunk
+        # an escape sequence may be split across two chunks
+        end = data.find(b"%", len(data) - 2)
+        if end < 0:
+            end = len(data)
+        output_stream.write(unquote_to_bytes(data[:end]))
+        pending = data[end:]
+    output_stream.write(unquote_to_bytes(pending))
+
+
+def decode_lines(input_stream: BinaryIO, output_stream: BinaryIO) -> None:
+    for line in iter(input_stream.readline, b""):
+        output_stream.write(unquote_to_bytes(line))
+        output_stream.flush()
 
 
 def main() -> None:
@@ -15,14 +36,16 @@ def main() -> None:
     Decode a percent encoded sequence.
     """
     parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("-l", "--lines", action="store_true")
     parser.add_argument("file", nargs="?")
     args = parser.parse_args()
 
+    function = decode_lines if args.lines else decode
     if args.file:
         with open(args.file, "rb") as f:
-            decode(f, sys.stdout.buffer)
+            function(f, sys.stdout.buffer)
     else:
-        decode(sys.stdin.buffer, sys.stdout.buffer)
+        function(sys.stdin.buffer, sys.stdout.buffer)
 
 
 if __name__ == "__main__":
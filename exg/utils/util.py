@@ -1,4 +1,5 @@
 import math
+import os
 
 
 def format_size(n: int) -> str:
@@ -8,3 +9,14 @@ def format_size(n: int) -> str:
     exp = int(math.log(n, 1024))
     size = n / (1 << (10 * exp))
     return f"{size:.2f}{units[exp]}"
+
+
+def cache_path(name: str) -> str:
+    """
+    Return the path of a file in the cache directory of exg.utils, as
+    defined by the XDG base directory specification.
+    """
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(
+        "~/.cache"
+    )
+    return os.path.join(cache_dir, "exg.utils", name)
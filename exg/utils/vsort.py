@@ -4,12 +4,29 @@
 # https://www.debian.org/doc/debian-policy/ch-controlfields.html#version
 # https://git.savannah.gnu.org/cgit/gnulib.git/plain/lib/filevercmp.c
 
+from __future__ import annotations
+
 import argparse
+import contextlib
+import heapq
+import os
 import re
 import string
 import sys
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import cache, lru_cache
+from itertools import groupby, islice
+from typing import TYPE_CHECKING, TextIO
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+DIGIT_RE = re.compile(r"(\D*)(\d*)")
 
 
+@cache
 def order(c: str) -> int:
     if c in string.ascii_letters:
         return ord(c)
@@ -18,24 +35,97 @@ def order(c: str) -> int:
     return ord(c) + 256
 
 
-def version_key(version: str) -> list[int]:
-    digit_re = re.compile(r"\d+")
-    nondigit_re = re.compile(r"\D+")
-    key = []
-    while version:
-        match = nondigit_re.match(version)
-        if match:
-            key.extend(order(c) for c in match.group(0))
-            version = version[len(match.group(0)) :]
+@lru_cache(maxsize=1 << 16)
+def version_key(version: str) -> tuple[int, ...]:
+    key: list[int] = []
+    for match in DIGIT_RE.finditer(version):
+        nondigits, digits = match.groups()
+        if not nondigits and not digits:
+            break
+        if nondigits:
+            key.extend(map(order, nondigits))
         else:
             key.append(0)
-        match = digit_re.match(version)
-        if match:
-            key.append(int(match.group(0)))
-            version = version[len(match.group(0)) :]
+        key.append(int(digits) if digits else 0)
+    return tuple(key)
+
+
+def _write_run(path: str, run: list[str], reverse: bool) -> None:
+    run.sort(key=version_key, reverse=reverse)
+    with open(path, "w", encoding="utf-8", errors="surrogateescape") as f:
+        f.writelines(f"{version}\n" for version in run)
+
+
+def _read_run(path: str) -> Iterator[str]:
+    with open(path, encoding="utf-8", errors="surrogateescape") as f:
+        for line in f:
+            yield line[:-1]
+
+
+def _spill_runs(
+    runs: Iterable[list[str]],
+    dirname: str,
+    reverse: bool,
+    jobs: int,
+) -> list[str]:
+    """
+    Sort each run and write it to a file in dirname, sorting up to jobs
+    runs in parallel.
+    """
+    paths = []
+    with contextlib.ExitStack() as stack:
+        executor = None
+        if jobs > 1:
+            executor = stack.enter_context(ProcessPoolExecutor(jobs))
+        pending: deque[Future[None]] = deque()
+        for i, run in enumerate(runs):
+            path = os.path.join(dirname, str(i))
+            paths.append(path)
+            if executor is None:
+                _write_run(path, run, reverse)
+                continue
+            # bound the number of runs held in memory
+            if len(pending) >= jobs:
+                pending.popleft().result()
+            pending.append(executor.submit(_write_run, path, run, reverse))
+        for future in pending:
+            future.result()
+    return paths
+
+
+def sort_versions(
+    versions: Iterable[str],
+    *,
+    reverse: bool = False,
+    unique: bool = False,
+    run_size: int | None = None,
+    jobs: int = 1,
+    tmpdir: str | None = None,
+) -> Iterator[str]:
+    """
+    Sort version numbers, in memory or, if run_size is set, by merging
+    sorted runs of run_size versions spilled to temporary files.
+    """
+    with contextlib.ExitStack() as stack:
+        if run_size is None:
+            merged: Iterator[str] = iter(
+                sorted(versions, key=version_key, reverse=reverse)
+            )
         else:
-            key.append(0)
-    return key
+            it = iter(versions)
+            runs = iter(lambda: list(islice(it, run_size)), [])
+            dirname = stack.enter_context(
+                tempfile.TemporaryDirectory(dir=tmpdir)
+            )
+            paths = _spill_runs(runs, dirname, reverse, jobs)
+            merged = heapq.merge(
+                *map(_read_run, paths),
+                key=version_key,
+                reverse=reverse,
+            )
+        if unique:
+            merged = (next(group) for _, group in groupby(merged, version_key))
+        yield from merged
 
 
 def main() -> None:
@@ -43,18 +133,55 @@ def main() -> None:
     Sort version numbers.
     """
     parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "-r",
+        "--reverse",
+        action="store_true",
+        help="reverse the result of comparisons",
+    )
+    parser.add_argument(
+        "-u",
+        "--unique",
+        action="store_true",
+        help="output only the first of an equal run",
+    )
+    parser.add_argument(
+        "-S",
+        "--buffer-size",
+        type=int,
+        help="sort runs of at most BUFFER_SIZE lines in memory and merge "
+        "them from temporary files",
+    )
+    parser.add_argument(
+        "-T",
+        "--temporary-directory",
+        help="use TEMPORARY_DIRECTORY for temporary files",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=1,
+        help="sort up to PARALLEL runs concurrently",
+    )
     parser.add_argument("file", nargs="?")
     args = parser.parse_args()
 
-    if args.file:
-        with open(args.file) as f:
-            versions = [line.rstrip() for line in f]
-    else:
-        versions = [line.rstrip() for line in sys.stdin]
-
-    versions.sort(key=version_key)
-    for version in versions:
-        print(version)
+    with contextlib.ExitStack() as stack:
+        f: TextIO
+        if args.file:
+            f = stack.enter_context(open(args.file))
+        else:
+            f = sys.stdin
+        versions = sort_versions(
+            (line.rstrip() for line in f),
+            reverse=args.reverse,
+            unique=args.unique,
+            run_size=args.buffer_size,
+            jobs=args.parallel,
+            tmpdir=args.temporary_directory,
+        )
+        for version in versions:
+            print(version)
 
 
 if __name__ == "__main__":
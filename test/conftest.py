@@ -0,0 +1,94 @@
+import struct
+
+import pytest
+
+from exg.utils import elf
+
+EM_X86_64 = 62
+# the virtual address of the segment holding the string table, which is
+# unrelated to its offset in the file
+STRTAB_VADDR = 0x10000
+
+
+def build_elf(
+    needed,
+    rpath=None,
+    runpath=None,
+    soname=None,
+    elf_class=64,
+    byteorder="<",
+    machine=EM_X86_64,
+):
+    """
+    Return a minimal ELF file with a dynamic section listing the given
+    entries, and a string table in its own PT_LOAD segment.
+    """
+    ehdr_format = "16sHHIQQQIHHHHHH" if elf_class == 64 else "16sHHIIIIIHHHHHH"
+    phdr_format = "IIQQQQQQ" if elf_class == 64 else "IIIIIIII"
+    dyn_format = "qQ" if elf_class == 64 else "iI"
+    ehdr_size = struct.calcsize(byteorder + ehdr_format)
+    phdr_size = struct.calcsize(byteorder + phdr_format)
+
+    strtab = bytearray(b"\x00")
+    dyns = []
+    for tag, values in (
+        (elf.DT_NEEDED, needed),
+        (elf.DT_RPATH, [rpath] if rpath else []),
+        (elf.DT_RUNPATH, [runpath] if runpath else []),
+        (elf.DT_SONAME, [soname] if soname else []),
+    ):
+        for value in values:
+            dyns.append((tag, len(strtab)))
+            strtab += value.encode() + b"\x00"
+    dyns.append((elf.DT_STRTAB, STRTAB_VADDR))
+    dyns.append((elf.DT_NULL, 0))
+
+    strtab_offset = ehdr_size + 2 * phdr_size
+    dyn_offset = strtab_offset + len(strtab)
+    dynamic = b"".join(struct.pack(byteorder + dyn_format, *d) for d in dyns)
+
+    def phdr(p_type, offset, vaddr, size):
+        if elf_class == 64:
+            fields = (p_type, 4, offset, vaddr, vaddr, size, size, 8)
+        else:
+            fields = (p_type, offset, vaddr, vaddr, size, size, 4, 4)
+        return struct.pack(byteorder + phdr_format, *fields)
+
+    ident = struct.pack(
+        "4sBBB9x",
+        b"\x7fELF",
+        2 if elf_class == 64 else 1,
+        1 if byteorder == "<" else 2,
+        1,
+    )
+    header = struct.pack(
+        byteorder + ehdr_format,
+        ident,
+        3,
+        machine,
+        1,
+        0,
+        ehdr_size,
+        0,
+        0,
+        ehdr_size,
+        phdr_size,
+        2,
+        0,
+        0,
+        0,
+    )
+    return b"".join(
+        (
+            header,
+            phdr(elf.PT_LOAD, strtab_offset, STRTAB_VADDR, len(strtab)),
+            phdr(elf.PT_DYNAMIC, dyn_offset, 0x20000, len(dynamic)),
+            strtab,
+            dynamic,
+        )
+    )
+
+
+@pytest.fixture
+def make_elf():
+    return build_elf
@@ -0,0 +1,45 @@
+import base64
+import binascii
+import io
+import os
+
+import pytest
+
+from exg.utils import b64decode
+
+DATA = base64.encodebytes(os.urandom(1000))
+INPUTS = [
+    b"",
+    DATA,
+    DATA + b"QQ==",
+    b"QQ==QUJD",
+    b"QQ=\n=QUJD",
+    b"QQ===QUJD",
+    b"QQ=Q=QUJD",
+    b"QUJ=QUJD",
+    b"QUJD=QUJD",
+    b"=QU=JD==QQ==",
+    b"QUJD" + b"=" * 100 + b"QQ==",
+]
+INVALID = [b"QQ", b"QQ=", b"QQ=QUJD", b"QUJDQ=", b"QUJDQQ=Q"]
+
+
+def decode(data, chunk_size):
+    output = io.BytesIO()
+    b64decode.decode(io.BytesIO(data), output, chunk_size)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("data", INPUTS)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64, 1 << 20])
+def test_decode(data, chunk_size):
+    assert decode(data, chunk_size) == base64.b64decode(data)
+
+
+@pytest.mark.parametrize("data", INVALID)
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 20])
+def test_decode_invalid(data, chunk_size):
+    with pytest.raises(binascii.Error):
+        base64.b64decode(data)
+    with pytest.raises(binascii.Error):
+        decode(data, chunk_size)
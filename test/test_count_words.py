@@ -0,0 +1,51 @@
+import sys
+
+import pytest
+
+from exg.utils import count_words
+
+WORDS = [("alpha", 3), ("beta", 1), ("gamma", 1 << 40), ("été", 2)]
+
+
+def run(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["count-words", *args])
+    count_words.main()
+
+
+def test_shard_round_trip(tmp_path):
+    path = str(tmp_path / "shard")
+    count_words.write_shard(path, WORDS)
+    assert list(count_words.read_shard(path)) == WORDS
+
+
+def test_merge_shards():
+    a = [("alpha", 1), ("beta", 2)]
+    b = [("alpha", 2), ("delta", 1)]
+    c = [("beta", 1), ("gamma", 4)]
+    assert list(count_words.merge_shards([a, b, c])) == [
+        ("alpha", 3),
+        ("beta", 3),
+        ("delta", 1),
+        ("gamma", 4),
+    ]
+
+
+def test_self_merge(tmp_path, monkeypatch, capsys):
+    text = tmp_path / "text"
+    text.write_text("foo bar foo\n")
+    total = str(tmp_path / "total")
+    run(monkeypatch, "-o", total, str(text))
+    run(monkeypatch, "-o", total, "-s", total, str(text))
+    assert list(count_words.read_shard(total)) == [("bar", 2), ("foo", 4)]
+    run(monkeypatch, "-f", "tsv", "-s", total)
+    assert capsys.readouterr().out == "foo\t4\nbar\t2\n"
+
+
+def test_truncated_shard(tmp_path):
+    path = tmp_path / "shard"
+    count_words.write_shard(str(path), WORDS)
+    data = path.read_bytes()
+    for size in (len(data) - 1, len(data) - len(WORDS[-1][0].encode()) - 1):
+        path.write_bytes(data[:size])
+        with pytest.raises(ValueError, match="truncated shard"):
+            list(count_words.read_shard(str(path)))
@@ -0,0 +1,69 @@
+import io
+import re
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from exg.utils import elf
+
+
+@pytest.mark.parametrize("elf_class", [32, 64])
+@pytest.mark.parametrize("byteorder", ["<", ">"])
+@pytest.mark.parametrize("mapped", [True, False])
+def test_elf_info(tmp_path, make_elf, elf_class, byteorder, mapped):
+    data = make_elf(
+        ["libfoo.so.1", "libc.so.6"],
+        rpath="$ORIGIN/../lib:/opt/lib",
+        runpath="/usr/local/lib",
+        soname="libbar.so.2",
+        elf_class=elf_class,
+        byteorder=byteorder,
+        machine=40,
+    )
+    path = tmp_path / "a.so"
+    path.write_bytes(data)
+    with open(path, "rb") as f:
+        # without a file descriptor, the file is read into memory
+        stream = f if mapped else io.BufferedReader(io.BytesIO(data))
+        info = elf.ELFInfo(stream)
+        assert info.elf_class == elf_class
+        assert info.machine == 40
+        assert list(info.get_deps()) == ["libfoo.so.1", "libc.so.6"]
+        assert info.get_rpath() == ["$ORIGIN/../lib", "/opt/lib"]
+        assert info.get_runpath() == ["/usr/local/lib"]
+        assert info.get_soname() == "libbar.so.2"
+
+
+@pytest.mark.parametrize("size", [0, 3, 16, 40])
+def test_truncated(tmp_path, make_elf, size):
+    path = tmp_path / "a.so"
+    path.write_bytes(make_elf(["libfoo.so.1"])[:size])
+    with open(path, "rb") as f, pytest.raises(ValueError):
+        elf.ELFInfo(f)
+
+
+def test_strtab_outside_segments(tmp_path, make_elf):
+    data = bytearray(make_elf(["libfoo.so.1"]))
+    # move the string table segment away from DT_STRTAB
+    vaddr = (0x10000).to_bytes(8, "little")
+    data[data.index(vaddr) : data.index(vaddr) + 8] = bytes(8)
+    path = tmp_path / "a.so"
+    path.write_bytes(data)
+    with open(path, "rb") as f:
+        assert list(elf.ELFInfo(f).get_deps()) == []
+
+
+@pytest.mark.skipif(shutil.which("readelf") is None, reason="no readelf")
+def test_readelf():
+    path = shutil.which("ls") or sys.executable
+    output = subprocess.run(
+        ["readelf", "-dW", path],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    needed = re.findall(r"\(NEEDED\)\s+Shared library: \[(.*)\]", output)
+    with open(path, "rb") as f:
+        assert list(elf.ELFInfo(f).get_deps()) == needed
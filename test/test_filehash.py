@@ -0,0 +1,39 @@
+import hashlib
+import os
+
+from exg.utils import filehash
+
+
+def test_hash_sample(tmp_path):
+    path = tmp_path / "a"
+    data = os.urandom(3 * filehash.SAMPLE_SIZE)
+    path.write_bytes(b"header" + data)
+    with open(path, "rb") as f:
+        assert filehash.hash_sample(f, 6, 100) == (
+            hashlib.sha256(data[:100]).hexdigest()
+        )
+        head = data[: filehash.SAMPLE_SIZE]
+        tail = data[-filehash.SAMPLE_SIZE :]
+        assert filehash.hash_sample(f, 6, len(data)) == (
+            hashlib.sha256(head + tail).hexdigest()
+        )
+    assert filehash.hash_file(str(path)) == (
+        hashlib.sha256(b"header" + data).hexdigest()
+    )
+
+
+def test_hash_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    a = tmp_path / "a"
+    b = tmp_path / "b"
+    a.write_bytes(b"a")
+    b.write_bytes(b"b")
+    # a cache in the current directory
+    with filehash.HashCache("cache.sqlite3") as cache:
+        cache.put(str(a), a.stat(), "sample", None)
+        cache.put(str(b), b.stat(), None, "digest")
+    b.write_bytes(b"modified")
+    with filehash.HashCache("cache.sqlite3") as cache:
+        assert cache.get(a.stat()) == ("sample", None)
+        assert cache.get(b.stat()) == (None, None)
+        assert cache.prune() == 1
@@ -0,0 +1,71 @@
+import re
+
+from exg.utils import ld_grep
+
+ALL = re.compile(".")
+
+
+def test_dep_index(tmp_path, monkeypatch, make_elf):
+    root = tmp_path / "bin"
+    (root / "sub").mkdir(parents=True)
+    (root / "a").write_bytes(make_elf(["libfoo.so.1", "libc.so.6"]))
+    (root / "b").write_bytes(make_elf(["libbar.so"]))
+    (root / "sub" / "c").write_bytes(make_elf(["libfoo.so.1"]))
+    (root / "text").write_text("not an executable")
+    a, b, c = (str(root / name) for name in ("a", "b", "sub/c"))
+
+    parsed = []
+    read_deps = ld_grep.read_deps
+
+    def count_read_deps(path):
+        parsed.append(path)
+        return read_deps(path)
+
+    monkeypatch.setattr(ld_grep, "read_deps", count_read_deps)
+    index = ld_grep.DepIndex(str(tmp_path / "index.db"))
+    with index:
+        index.update([str(root)], recursive=True)
+        assert len(parsed) == 4
+        assert list(index.grep(re.compile("foo"))) == [
+            (a, ["libfoo.so.1", "libc.so.6"]),
+            (c, ["libfoo.so.1"]),
+        ]
+        assert list(index.get_dependents("libfoo.so.1")) == [a, c]
+
+        # only the changed files are parsed again
+        parsed.clear()
+        (root / "sub" / "c").unlink()
+        (root / "b").write_bytes(make_elf(["libfoo.so.1", "libbar.so"]))
+        index.update([str(root)], recursive=True)
+        assert parsed == [b]
+        assert list(index.get_dependents("libfoo.so.1")) == [a, b]
+        assert list(index.get_dependents("libbar.so")) == [b]
+
+        # the entries under a directory that is not walked are kept
+        parsed.clear()
+        index.update([str(root), a], recursive=False)
+        assert parsed == []
+        assert [path for path, _ in index.grep(ALL)] == [a, b]
+
+
+def test_dep_index_prune_file(tmp_path, make_elf):
+    path = tmp_path / "a"
+    path.write_bytes(make_elf(["libfoo.so.1"]))
+    with ld_grep.DepIndex(str(tmp_path / "index.db")) as index:
+        index.update([str(path)], recursive=False)
+        assert list(index.grep(ALL)) == [(str(path), ["libfoo.so.1"])]
+        path.unlink()
+        index.update([str(path)], recursive=False)
+        assert list(index.grep(ALL)) == []
+
+
+def test_find_files(tmp_path):
+    (tmp_path / "d" / "e").mkdir(parents=True)
+    (tmp_path / "d" / "e" / "f").touch()
+    (tmp_path / "g").touch()
+    paths = [str(tmp_path / "d"), str(tmp_path / "g")]
+    assert list(ld_grep.find_files(paths, recursive=False)) == [paths[1]]
+    assert list(ld_grep.find_files(paths, recursive=True)) == [
+        str(tmp_path / "d" / "e" / "f"),
+        paths[1],
+    ]
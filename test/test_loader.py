@@ -0,0 +1,84 @@
+import os
+
+from exg.utils import loader
+
+
+def make_resolver(ld_library_path=""):
+    return loader.Resolver(
+        ld_so_conf="/nonexistent/ld.so.conf",
+        ld_library_path=ld_library_path,
+    )
+
+
+def test_get_closure(tmp_path, make_elf):
+    tmp_path = tmp_path.resolve()
+    for name in ("bin", "lib", "lib32", "other"):
+        (tmp_path / name).mkdir()
+    prog = tmp_path / "bin" / "prog"
+    prog.write_bytes(
+        make_elf(["libA.so"], rpath="$ORIGIN/../lib32:${ORIGIN}/../lib")
+    )
+    # skipped as a library of another architecture
+    (tmp_path / "lib32" / "libA.so").write_bytes(
+        make_elf(["libB.so"], elf_class=32)
+    )
+    # found through the RPATH of the executable
+    (tmp_path / "lib" / "libA.so").write_bytes(make_elf(["libB.so"]))
+    (tmp_path / "lib" / "libB.so").write_bytes(
+        make_elf(["libC.so"], runpath=str(tmp_path / "other"))
+    )
+    (tmp_path / "other" / "libC.so").write_bytes(
+        make_elf(["libD.so", "libB.so"], runpath="$ORIGIN")
+    )
+    # not searched, as libC.so has a RUNPATH
+    (tmp_path / "lib" / "libD.so").write_bytes(make_elf([]))
+
+    lib = tmp_path / "lib"
+    other = tmp_path / "other"
+    assert make_resolver().get_closure(str(prog)) == {
+        str(prog): [("libA.so", str(lib / "libA.so"))],
+        str(lib / "libA.so"): [("libB.so", str(lib / "libB.so"))],
+        str(lib / "libB.so"): [("libC.so", str(other / "libC.so"))],
+        str(other / "libC.so"): [
+            ("libD.so", None),
+            ("libB.so", None),
+        ],
+    }
+
+
+def test_search_order(tmp_path, make_elf):
+    tmp_path = tmp_path.resolve()
+    for name in ("rpath", "env", "runpath"):
+        (tmp_path / name).mkdir()
+        for lib in ("libA.so", "libB.so"):
+            (tmp_path / name / lib).write_bytes(make_elf([]))
+    env = str(tmp_path / "env")
+    rpath_prog = tmp_path / "rpath_prog"
+    rpath_prog.write_bytes(make_elf(["libA.so"], rpath=str(tmp_path / "rpath")))
+    runpath_prog = tmp_path / "runpath_prog"
+    runpath_prog.write_bytes(
+        make_elf(
+            ["libB.so"],
+            rpath=str(tmp_path / "rpath"),
+            runpath=str(tmp_path / "runpath"),
+        )
+    )
+    resolver = make_resolver(env)
+    # RPATH comes before LD_LIBRARY_PATH, which comes before RUNPATH, and
+    # a RUNPATH disables the RPATH
+    assert resolver.get_closure(str(rpath_prog))[str(rpath_prog)] == [
+        ("libA.so", str(tmp_path / "rpath" / "libA.so"))
+    ]
+    assert resolver.get_closure(str(runpath_prog))[str(runpath_prog)] == [
+        ("libB.so", os.path.join(env, "libB.so"))
+    ]
+    resolver = make_resolver()
+    assert resolver.get_closure(str(runpath_prog))[str(runpath_prog)] == [
+        ("libB.so", str(tmp_path / "runpath" / "libB.so"))
+    ]
+
+
+def test_get_closure_not_executable(tmp_path):
+    path = tmp_path / "text"
+    path.write_text("text")
+    assert make_resolver().get_closure(str(path)) is None
@@ -0,0 +1,115 @@
+import io
+import struct
+
+import pytest
+
+from exg.utils import macho
+
+CPU_TYPE_X86_64 = 0x01000007
+CPU_TYPE_ARM64 = 0x0100000C
+CPU_TYPE_POWERPC = 0x12
+
+
+def pad(data, alignment=8):
+    return data + b"\x00" * (-len(data) % alignment)
+
+
+def build_slice(commands, cputype, bits=64, byteorder="<"):
+    """
+    Return a Mach-O file with the given (cmd, string) load commands, where
+    string is the name of a dylib or an rpath.
+    """
+    data = b""
+    for cmd, string in commands:
+        if cmd == macho.LC_RPATH:
+            body = struct.pack(byteorder + "I", 12)
+        else:
+            body = struct.pack(byteorder + "IIII", 24, 0, 1 << 16, 1 << 16)
+        payload = pad(body + string.encode() + b"\x00", 8)
+        data += struct.pack(byteorder + "II", cmd, len(payload) + 8) + payload
+    magic = 0xFEEDFACF if bits == 64 else 0xFEEDFACE
+    header = struct.pack(
+        byteorder + "7I", magic, cputype, 3, 6, len(commands), len(data), 0
+    )
+    if bits == 64:
+        header += b"\x00" * 4
+    return header + data
+
+
+def build_fat(slices, bits=32):
+    arch_format = ">IIIII" if bits == 32 else ">IIQQII"
+    magic = 0xCAFEBABE if bits == 32 else 0xCAFEBABF
+    header = struct.pack(">II", magic, len(slices))
+    offset = 1 << 12
+    archs = b""
+    body = b""
+    for cputype, data in slices:
+        fields = [cputype, 3, offset + len(body), len(data), 12]
+        if bits == 64:
+            fields.append(0)
+        archs += struct.pack(arch_format, *fields)
+        body += pad(data, 1 << 12)
+    return pad(header + archs, offset) + body
+
+
+def parse(data):
+    return macho.MachOInfo(io.BufferedReader(io.BytesIO(data)))
+
+
+COMMANDS = [
+    (macho.LC_LOAD_DYLIB, "/usr/lib/libSystem.B.dylib"),
+    (macho.LC_LOAD_WEAK_DYLIB, "@rpath/libweak.dylib"),
+    (macho.LC_REEXPORT_DYLIB, "@loader_path/libreexport.dylib"),
+    (macho.LC_RPATH, "@loader_path/../lib"),
+]
+DEPS = [name for cmd, name in COMMANDS if cmd != macho.LC_RPATH]
+
+
+@pytest.mark.parametrize("bits", [32, 64])
+@pytest.mark.parametrize("byteorder", ["<", ">"])
+def test_thin(bits, byteorder):
+    info = parse(build_slice(COMMANDS, CPU_TYPE_POWERPC, bits, byteorder))
+    assert info.get_archs() == [(CPU_TYPE_POWERPC, 3)]
+    assert list(info.get_deps()) == DEPS
+    assert list(info.get_rpaths()) == ["@loader_path/../lib"]
+
+
+@pytest.mark.parametrize("bits", [32, 64])
+def test_fat(bits):
+    lazy = (macho.LC_LAZY_LOAD_DYLIB, "/usr/lib/liblazy.dylib")
+    upward = (macho.LC_LOAD_UPWARD_DYLIB, "/usr/lib/libupward.dylib")
+    data = build_fat(
+        [
+            (CPU_TYPE_X86_64, build_slice([*COMMANDS, lazy], CPU_TYPE_X86_64)),
+            (CPU_TYPE_ARM64, build_slice([*COMMANDS, upward], CPU_TYPE_ARM64)),
+        ],
+        bits,
+    )
+    info = parse(data)
+    assert info.get_archs() == [(CPU_TYPE_X86_64, 3), (CPU_TYPE_ARM64, 3)]
+    # the union of the dependencies of the slices, in order
+    assert list(info.get_deps()) == [*DEPS, lazy[1], upward[1]]
+    assert list(info.get_rpaths()) == ["@loader_path/../lib"]
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        b"\x7fELF" + bytes(60),
+        # a Java class file, version 52.0
+        struct.pack(">IHH", 0xCAFEBABE, 0, 52) + bytes(32),
+        # a fat binary whose slice is missing
+        build_fat([(CPU_TYPE_X86_64, build_slice(COMMANDS, 7))])[:4096],
+    ],
+)
+def test_invalid(data):
+    with pytest.raises(ValueError):
+        parse(data)
+
+
+def test_truncated_commands():
+    data = build_slice(COMMANDS, CPU_TYPE_X86_64)
+    # the commands that are cut off are ignored
+    info = parse(data[:-40])
+    assert list(info.get_deps()) == DEPS[:2]
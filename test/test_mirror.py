@@ -1,7 +1,12 @@
 import hashlib
 import os
+import re
+import shutil
+import subprocess
 from pathlib import Path
 
+import pytest
+
 from exg.utils import mirror
 
 PATHS = (
@@ -11,11 +16,28 @@ PATHS = (
 )
 
 
+@pytest.fixture
+def real_rsync():
+    """
+    Fail unless rsync is installed: the tests that use it check the
+    behavior of its filter, deletion and --link-dest options, which a
+    stand-in would only mimic.
+    """
+    try:
+        output = subprocess.run(
+            ["rsync", "--version"], capture_output=True, text=True
+        ).stdout
+    except FileNotFoundError:
+        pytest.fail("rsync is required")
+    if not re.match(r"rsync\s+version\s+\d", output):
+        pytest.fail(f"{shutil.which('rsync')} is not rsync")
+
+
 def map_dir(function, root):
     return {
         path.relative_to(root): function(path)
         for path in root.rglob("*")
-        if path.is_file() and path.name != ".ino-index.json"
+        if path.is_file() and path.name != mirror.INDEX_NAME
     }
 
 
@@ -27,6 +49,7 @@ def hash_file(path):
     return hashlib.sha256(path.read_bytes()).hexdigest()
 
 
+@pytest.mark.usefixtures("real_rsync")
 def test_mirror(tmp_path):
     src_dir = tmp_path / "src"
     dst_dir = tmp_path / "dst"
@@ -55,6 +78,175 @@ def test_mirror(tmp_path):
     rsync.mirror(dry_run=False)
     inodes_post = map_dir(file_inode, dst_dir)
     assert map_dir(hash_file, src_dir) == map_dir(hash_file, dst_dir)
+    assert rsync.stats.files == len(PATHS)
+    assert rsync.stats.renames == len(PATHS)
     assert inodes_pre[PATHS[0]] == inodes_post[PATHS[1]]
     assert inodes_pre[PATHS[1]] == inodes_post[PATHS[0]]
     assert inodes_pre[PATHS[2]] == inodes_post[PATHS[2].with_suffix(".txt")]
+
+
+def test_scan_tree(tmp_path):
+    for path in (
+        "a",
+        "b.tmp",
+        "c/a",
+        "c/d/a",
+        "c/d/b.tmp",
+        "c/e/f",
+        "d/a",
+        "e/f/g",
+    ):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path)
+    (tmp_path / ".ignore").write_text("*.tmp\ne/\n")
+    (tmp_path / "c" / ".ignore").write_text("/a\n# a\nd/b*\n")
+    (tmp_path / "g").symlink_to("a")
+
+    index = mirror.scan_tree(str(tmp_path), ["f"])
+    assert sorted(index.values()) == [
+        ".ignore",
+        "a",
+        "c/.ignore",
+        "c/d/a",
+        "d/a",
+    ]
+    assert all(
+        (tmp_path / path).stat().st_ino == ino for ino, path in index.items()
+    )
+
+
+@pytest.mark.usefixtures("real_rsync")
+def test_mirror_filtered(tmp_path):
+    src_dir = tmp_path / "src"
+    dst_dir = tmp_path / "dst"
+    rsync = mirror.Rsync(
+        args=["--max-size=10"],
+        src=mirror.Address(None, f"{src_dir}/"),
+        dest=mirror.Address(None, str(dst_dir)),
+    )
+
+    src_dir.mkdir()
+    (src_dir / "small").write_text("small")
+    (src_dir / "large").write_text("large" * 10)
+    rsync.mirror(dry_run=False)
+    assert rsync.stats.files == 1
+    assert map_dir(hash_file, dst_dir).keys() == {Path("small")}
+
+    # the large file was never copied, so it cannot be linked
+    inodes_pre = map_dir(file_inode, dst_dir)
+    for name in ("small", "large"):
+        (src_dir / name).rename(src_dir / f"{name}.new")
+    rsync.mirror(dry_run=False)
+    inodes_post = map_dir(file_inode, dst_dir)
+    assert rsync.stats.renames == 1
+    assert inodes_post == {Path("small.new"): inodes_pre[Path("small")]}
+
+
+def test_create_link_dest_dir(tmp_path):
+    dst_dir = tmp_path / "dst"
+    (dst_dir / "d").mkdir(parents=True)
+    (dst_dir / "a").write_text("a")
+    renames = {"b": "a", "c": "missing", "e": "d"}
+    tempdir, size = mirror.create_link_dest_dir(str(dst_dir), renames)
+    with tempdir as link_dest:
+        assert os.listdir(link_dest) == ["b"]
+        assert size == 1
+
+
+@pytest.mark.usefixtures("real_rsync")
+def test_mirror_match_content(tmp_path):
+    src_dir = tmp_path / "src"
+    dst_dir = tmp_path / "dst"
+    rsync = mirror.Rsync(
+        args=[],
+        src=mirror.Address(None, f"{src_dir}/"),
+        dest=mirror.Address(None, str(dst_dir)),
+        match_content=True,
+        cache_path=str(tmp_path / "cache.sqlite3"),
+    )
+
+    src_dir.mkdir()
+    for name, size in (("a", 1 << 20), ("b", 100)):
+        (src_dir / name).write_bytes(os.urandom(size))
+    rsync.mirror(dry_run=False)
+
+    # fresh copies with new inodes, and a file with the same size and
+    # modification time but another content, likely reusing an inode
+    inodes_pre = map_dir(file_inode, dst_dir)
+    for name in ("a", "b"):
+        shutil.copy2(src_dir / name, src_dir / f"{name}.new")
+        (src_dir / name).unlink()
+    (src_dir / "c").write_bytes(os.urandom(100))
+    shutil.copystat(src_dir / "b.new", src_dir / "c")
+    rsync.mirror(dry_run=False)
+    inodes_post = map_dir(file_inode, dst_dir)
+    assert map_dir(hash_file, src_dir) == map_dir(hash_file, dst_dir)
+    assert inodes_pre[Path("a")] == inodes_post[Path("a.new")]
+    assert inodes_pre[Path("b")] == inodes_post[Path("b.new")]
+    assert inodes_pre[Path("b")] != inodes_post[Path("c")]
+
+
+@pytest.mark.usefixtures("real_rsync")
+def test_mirror_remote(tmp_path):
+    # stand-in for ssh running the remote command locally
+    rsh = tmp_path / "rsh"
+    rsh.write_text('#!/bin/sh\nshift\nexec sh -c "$*"\n')
+    rsh.chmod(0o755)
+
+    src_dir = tmp_path / "src"
+    dst_dir = tmp_path / "dst"
+    for path in PATHS:
+        (src_dir / path).parent.mkdir(parents=True, exist_ok=True)
+        (src_dir / path).write_text(str(path))
+    for src, dest in (
+        (
+            mirror.Address(None, f"{src_dir}/"),
+            mirror.Address("host", str(dst_dir)),
+        ),
+        (
+            mirror.Address("host", f"{src_dir}/"),
+            mirror.Address(None, str(dst_dir)),
+        ),
+    ):
+        rsync = mirror.Rsync(args=["--rsh", str(rsh)], src=src, dest=dest)
+        rsync.mirror(dry_run=False)
+        assert map_dir(hash_file, src_dir) == map_dir(hash_file, dst_dir)
+
+        inodes_pre = map_dir(file_inode, dst_dir)
+        for path in PATHS:
+            (src_dir / path).rename((src_dir / path).with_suffix(".new"))
+        rsync.mirror(dry_run=False)
+        inodes_post = map_dir(file_inode, dst_dir)
+        assert map_dir(hash_file, src_dir) == map_dir(hash_file, dst_dir)
+        for path in PATHS:
+            assert inodes_pre[path] == inodes_post[path.with_suffix(".new")]
+            (src_dir / path.with_suffix(".new")).rename(src_dir / path)
+
+
+@pytest.mark.usefixtures("real_rsync")
+def test_mirror_jobs(tmp_path):
+    src_dir = tmp_path / "src"
+    dst_dir = tmp_path / "dst"
+    rsync = mirror.Rsync(
+        args=[],
+        src=mirror.Address(None, f"{src_dir}/"),
+        dest=mirror.Address(None, str(dst_dir)),
+        jobs=2,
+    )
+
+    # names with characters that are special in rsync patterns
+    paths = (*PATHS, Path("4"), Path("[5]") / "d", Path("6\\") / "e")
+    for path in paths:
+        (src_dir / path).parent.mkdir(parents=True, exist_ok=True)
+        (src_dir / path).write_text(str(path))
+    rsync.mirror(dry_run=False)
+    assert map_dir(hash_file, src_dir) == map_dir(hash_file, dst_dir)
+
+    # a rename across top-level directories and a deletion
+    inodes_pre = map_dir(file_inode, dst_dir)
+    (src_dir / PATHS[0]).rename(src_dir / PATHS[1].with_suffix(".new"))
+    (src_dir / PATHS[2]).unlink()
+    rsync.mirror(dry_run=False)
+    inodes_post = map_dir(file_inode, dst_dir)
+    assert map_dir(hash_file, src_dir) == map_dir(hash_file, dst_dir)
+    assert inodes_pre[PATHS[0]] == inodes_post[PATHS[1].with_suffix(".new")]
@@ -0,0 +1,31 @@
+import os
+
+from exg.utils import mp3sum
+
+ID3 = b"ID3\x04\x00\x00\x00\x00\x00\x02ab"
+
+
+def test_find_duplicates(tmp_path):
+    audio = os.urandom(1 << 18)
+    a = tmp_path / "a.mp3"
+    b = tmp_path / "b.mp3"
+    c = tmp_path / "c.mp3"
+    a.write_bytes(ID3 + audio)
+    b.write_bytes(audio)
+    c.write_bytes(audio[:-1] + b"x")
+    os.link(a, tmp_path / "d.mp3")
+    paths = list(mp3sum.find_files([str(a), str(tmp_path)]))
+    assert mp3sum.find_duplicates(paths) == [[str(a), str(b)]]
+
+
+def test_find_duplicates_errors(tmp_path):
+    a = tmp_path / "a.mp3"
+    a.write_bytes(b"audio")
+    missing = str(tmp_path / "missing.mp3")
+    errors = []
+    groups = mp3sum.find_duplicates(
+        [str(a), missing, str(a), missing],
+        on_error=lambda path, e: errors.append(path),
+    )
+    assert groups == []
+    assert errors == [missing]
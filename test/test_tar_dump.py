@@ -0,0 +1,32 @@
+import io
+import sys
+import tarfile
+
+import pytest
+
+from exg.utils import tar_dump
+
+
+def run(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["tar-dump", *args])
+    output = io.BytesIO()
+    monkeypatch.setattr(sys, "stdout", io.TextIOWrapper(output))
+    tar_dump.main()
+    sys.stdout.flush()
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("use_index", [False, True])
+def test_extract(tmp_path, monkeypatch, use_index):
+    path = tmp_path / "a.tar.gz"
+    with tarfile.open(path, "w:gz") as tf:
+        for name, data in (("a", b"first"), ("b", b"second")):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    args = ["-x", "b", str(path)]
+    if use_index:
+        args.insert(0, "-i")
+    assert run(monkeypatch, *args) == b"second"
+    # the sidecar index is written only with -i
+    assert (tmp_path / "a.tar.gz.idx").exists() == use_index
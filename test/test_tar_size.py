@@ -0,0 +1,30 @@
+import pytest
+
+from exg.utils import tar_size
+
+MEMBERS = [
+    ("a", 0, True),
+    ("a/b", 100, False),
+    ("a/c", 0, True),
+    ("a/c/d", 10, False),
+    ("e", 1, False),
+]
+
+
+@pytest.mark.parametrize("prefix", ["", "./"])
+def test_get_dir_sizes(prefix):
+    members = [(prefix + name, *rest) for name, *rest in MEMBERS]
+    if prefix:
+        members.insert(0, (prefix, 0, True))
+    assert tar_size.get_dir_sizes(members, "", 0) == {".": 111}
+    assert tar_size.get_dir_sizes(members, "", 1) == {".": 111, "a": 110}
+    assert tar_size.get_dir_sizes(members, "", 2) == {
+        ".": 111,
+        "a": 110,
+        "a/c": 10,
+    }
+    assert tar_size.get_dir_sizes(members, prefix + "a/c", 2) == {
+        ".": 10,
+        "a": 10,
+        "a/c": 10,
+    }
@@ -0,0 +1,184 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import random
+import shutil
+import subprocess
+import tarfile
+
+import pytest
+
+from exg.utils import tarindex
+
+FORMATS = {
+    "gnu": tarfile.GNU_FORMAT,
+    "pax": tarfile.PAX_FORMAT,
+    "ustar": tarfile.USTAR_FORMAT,
+}
+
+
+def add_file(tf, name, data, **attrs):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    for key, value in attrs.items():
+        setattr(info, key, value)
+    tf.addfile(info, io.BytesIO(data))
+
+
+def make_tar(file_format, count=20, size=1000):
+    """
+    Return an uncompressed archive with regular files of random content,
+    a directory, links and, where the format allows, long names.
+    """
+    rng = random.Random(count)
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w", format=file_format) as tf:
+        info = tarfile.TarInfo("dir")
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        tf.addfile(info)
+        for i in range(count):
+            add_file(tf, f"dir/f{i}", rng.randbytes(rng.randint(0, size)))
+        add_file(tf, "d" * 90 + "/" + "n" * 90, b"prefix", mode=0o600)
+        if file_format != tarfile.USTAR_FORMAT:
+            add_file(tf, "l" * 300, b"long name")
+            add_file(tf, "big", b"", mtime=1 << 40)
+        if file_format == tarfile.PAX_FORMAT:
+            add_file(tf, "caf\xe9", b"pax", pax_headers={"comment": "x"})
+        for link_type, name in (
+            (tarfile.SYMTYPE, "symlink"),
+            (tarfile.LNKTYPE, "hardlink"),
+        ):
+            info = tarfile.TarInfo(name)
+            info.type = link_type
+            info.linkname = "dir/f0"
+            tf.addfile(info)
+    return buf.getvalue()
+
+
+def tarfile_entries(path):
+    with tarfile.open(path) as tf:
+        return [tarindex.Entry.from_tarinfo(member) for member in tf]
+
+
+@pytest.mark.parametrize("name", FORMATS)
+def test_scan_entries(tmp_path, name):
+    path = tmp_path / "a.tar"
+    path.write_bytes(make_tar(FORMATS[name]))
+    expected = tarfile_entries(path)
+    with open(path, "rb") as f:
+        assert list(tarindex.scan_entries(f)) == expected
+    with open(path, "rb") as f:
+        assert list(tarindex.scan_entries(f, seekable=False)) == expected
+    assert list(tarindex.iter_entries(str(path))) == expected
+
+
+def test_iter_entries_sparse(tmp_path):
+    # sparse files, here in the pax format 0.1, are read by tarfile
+    path = tmp_path / "sparse.tar"
+    with tarfile.open(path, "w", format=tarfile.PAX_FORMAT) as tf:
+        add_file(tf, "before", b"1")
+        add_file(
+            tf,
+            "sparse",
+            b"data",
+            pax_headers={
+                "GNU.sparse.map": "4096,4",
+                "GNU.sparse.name": "sparse",
+                "GNU.sparse.size": "8192",
+            },
+        )
+        add_file(tf, "after", b"2")
+    expected = tarfile_entries(path)
+    assert expected[1].size == 8192
+    with open(path, "rb") as f, pytest.raises(tarindex.UnsupportedHeader):
+        list(tarindex.scan_entries(f))
+    assert list(tarindex.iter_entries(str(path))) == expected
+
+
+def write_gzip_members(path, data, count):
+    with open(path, "wb") as f:
+        size = -(-len(data) // count)
+        for i in range(0, len(data), size):
+            f.write(gzip.compress(data[i : i + size]))
+
+
+@pytest.mark.parametrize("output_limit", [1 << 25, 1 << 12])
+def test_iter_decompressed_jobs(tmp_path, monkeypatch, output_limit):
+    monkeypatch.setattr(tarindex, "RANGE_SIZE", 1 << 14)
+    monkeypatch.setattr(tarindex, "RANGE_OUTPUT_LIMIT", output_limit)
+    data = make_tar(tarfile.GNU_FORMAT, count=200, size=4000)
+    path = tmp_path / "a.tar.gz"
+    write_gzip_members(path, data, 16)
+    with open(path, "rb") as f:
+        assert len(tarindex._split_gzip(f, path.stat().st_size)) > 2
+    chunks = tarindex.iter_decompressed(str(path), "gz", jobs=4)
+    assert b"".join(chunks) == data
+    expected = tarfile_entries(path)
+    assert list(tarindex.iter_entries(str(path), jobs=4)) == expected
+
+
+@pytest.mark.parametrize("compression", ["gz", "bz2", "xz"])
+def test_decompress_reader_output_limit(monkeypatch, compression):
+    monkeypatch.setattr(tarindex, "OUTPUT_CHUNK_SIZE", 1 << 12)
+    compress = {"gz": gzip.compress, "bz2": bz2.compress, "xz": lzma.compress}
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tf:
+        add_file(tf, "zeros", bytes(1 << 23))
+    data = buf.getvalue()
+    members = [compress[compression](data[:1024]), compress[compression](data)]
+    starts = []
+    reader = tarindex.DecompressReader(
+        io.BytesIO(b"".join(members)),
+        compression,
+        lambda *offsets: starts.append(offsets),
+    )
+    output = bytearray()
+    while chunk := reader.read(1 << 16):
+        # a single input chunk must not be inflated at once
+        assert len(reader._buffer) <= 1 << 12
+        output += chunk
+    assert output == data[:1024] + data
+    assert starts == [(0, 0), (1024, len(members[0]))]
+
+
+def check_index(path, data):
+    index = tarindex.get_index(str(path))
+    assert os.path.exists(f"{path}.idx")
+    assert tarindex.get_index(str(path)) == index
+    with tarfile.open(fileobj=io.BytesIO(data)) as tf:
+        assert index.entries == [
+            tarindex.Entry.from_tarinfo(member) for member in tf
+        ]
+        for entry in index.entries:
+            if entry.type == "0":
+                member_data = b"".join(index.read_member(str(path), entry))
+                assert member_data == tf.extractfile(entry.name).read()
+    return index
+
+
+@pytest.mark.parametrize("compression", ["gz", "bz2", "xz"])
+def test_index(tmp_path, compression):
+    compress = {"gz": gzip.compress, "bz2": bz2.compress, "xz": lzma.compress}
+    path = tmp_path / f"a.tar.{compression}"
+    data = make_tar(tarfile.PAX_FORMAT)
+    path.write_bytes(compress[compression](data))
+    assert check_index(path, data).compression == compression
+
+
+def test_index_checkpoints(tmp_path, monkeypatch):
+    monkeypatch.setattr(tarindex, "CHECKPOINT_SPACING", 1 << 14)
+    path = tmp_path / "a.tar.gz"
+    data = make_tar(tarfile.GNU_FORMAT, count=200, size=4000)
+    write_gzip_members(path, data, 16)
+    assert len(check_index(path, data).checkpoints) > 1
+
+
+@pytest.mark.skipif(shutil.which("zstd") is None, reason="zstd not found")
+def test_index_zstd(tmp_path):
+    path = tmp_path / "a.tar.zst"
+    data = make_tar(tarfile.GNU_FORMAT)
+    subprocess.run(["zstd", "-q", "-o", str(path)], input=data, check=True)
+    assert check_index(path, data).compression == "zst"
@@ -0,0 +1,36 @@
+import random
+
+import pytest
+
+from exg.utils import vsort
+
+
+def make_versions(n):
+    rng = random.Random(0)
+    parts = ["1", "01", "2", "10", "a", "b", "~rc1", "-", ".", "+dfsg"]
+    return [
+        "".join(rng.choice(parts) for _ in range(rng.randint(1, 5)))
+        for _ in range(n)
+    ]
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+@pytest.mark.parametrize("unique", [False, True])
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_sort_versions_runs(tmp_path, reverse, unique, jobs):
+    versions = make_versions(1000)
+    # distinct versions that compare equal, such as 1 and 01
+    assert len(set(map(vsort.version_key, versions))) < len(set(versions))
+    expected = list(
+        vsort.sort_versions(versions, reverse=reverse, unique=unique)
+    )
+    result = vsort.sort_versions(
+        versions,
+        reverse=reverse,
+        unique=unique,
+        run_size=64,
+        jobs=jobs,
+        tmpdir=str(tmp_path),
+    )
+    assert list(result) == expected
+    assert not list(tmp_path.iterdir())